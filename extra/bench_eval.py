@@ -0,0 +1,100 @@
+"""
+Benchmark of the evaluation of expressions: a 100k-iteration loop is
+compiled with the code objects cached (values compile their expressions
+once, see values module) and uncached, where every evaluation compiles
+the source text again, either through the sandbox (compile_expr without
+its cache) or by eval of the text as it was before the cache. Loops are
+not batched or optimized, so every iteration evaluates its expressions.
+
+    python extra/bench_eval.py
+    python extra/bench_eval.py --iterations 10000 --repeat 5
+"""
+
+import os
+import sys
+import time
+import argparse
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pcbscript.compiler import Compiler
+from pcbscript.values import GLOBALS, Number, Coord, compile_expr
+
+
+SCRIPT = '''board 100,100
+for i in 0..{iterations}:
+    pin (i%100)*0.5+1,(i//100)*0.1+1
+'''
+
+# Expressions evaluated by an iteration: the condition of the loop, x and
+# y of the pin and the increment
+EVALS_PER_ITERATION = 4
+
+
+def _checked(source):
+    return compile_expr.__wrapped__(source)
+
+
+def _text(source):
+    return source
+
+
+@contextmanager
+def uncached(compile_source):
+    # Values evaluate their source text compiling it every time
+    number_eval, coord_eval = Number.eval, Coord.eval
+
+    def eval_number(self, scope={}):
+        return eval(compile_source(self.value), GLOBALS, scope)
+
+    def eval_coord(self, scope={}):
+        return (eval(compile_source(self.x), GLOBALS, scope),
+                eval(compile_source(self.y), GLOBALS, scope))
+
+    Number.eval, Coord.eval = eval_number, eval_coord
+    try:
+        yield
+    finally:
+        Number.eval, Coord.eval = number_eval, coord_eval
+
+
+def measure(code, repeat):
+    best = None
+    for _ in range(repeat):
+        compiler = Compiler(batch=False, optimize=False)
+        started = time.perf_counter()
+        compiler.compile(code)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    code = SCRIPT.format(iterations=args.iterations)
+    evals = args.iterations * EVALS_PER_ITERATION
+
+    results = []
+    for name, compile_source in (('sandbox', _checked), ('eval text', _text)):
+        with uncached(compile_source):
+            results.append((name, measure(code, args.repeat)))
+    cached = measure(code, args.repeat)
+    results.append(('cached', cached))
+
+    print(f"{args.iterations} iterations, {evals} evaluations, "
+          f"best of {args.repeat}")
+    for name, elapsed in results:
+        print(f"{name:>10}: {elapsed:8.3f} s, "
+              f"{elapsed / args.iterations * 1e6:7.2f} us per iteration, "
+              f"{elapsed / evals * 1e6:7.2f} us per evaluation, "
+              f"{elapsed / cached:5.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,38 +2,175 @@
 Compile into a text file:
     pcbscript compile -i 1.pcbs -o 1.txt
 
+Compile into a binary file of items, then draw or export it without
+compiling again:
+    pcbscript compile -i 1.pcbs -o 1.pcbi
+    pcbscript draw -i 1.pcbi -o 1.svg
+
 Compile into an SVG image:
     pcbscript draw -i 1.pcbs -o 1.svg
 
+Compiled items are cached in ~/.cache/pcbscript (up to --cache-size MB),
+so running again with the same code and options does not compile it:
+    pcbscript draw -i 1.pcbs -o 1.svg --no-cache
+
 Compile into an SVG image and redraw it if changes happen:
     pcbscript draw -i 1.pcbs -o 1.svg --watch
 
 Prepare a picture on a sheet of paper to print:
     pcbscript prepare -i 1.pcbs -o 1.jpg --dpi 300 --format A4
+
+Execute the script by the closure engine instead of the interpreter loop:
+    pcbscript compile -i 1.pcbs -o 1.txt --engine closure
+
+Inline the calls of macros (constant arguments go right into the body):
+    pcbscript compile -i 1.pcbs -o 1.txt --inline
+
+Execute the script as written, without folding constants and dropping
+dead branches first:
+    pcbscript compile -i 1.pcbs -o 1.txt --no-optimize
+
+Stop a script that executes more than a million nodes, emits more than
+100000 items or runs longer than 10 seconds:
+    pcbscript draw -i 1.pcbs -o 1.svg --max-steps 1000000 \
+        --max-items 100000 --timeout 10
+
+Write SVG directly as text instead of building it with svgwrite:
+    pcbscript draw -i 1.pcbs -o 1.svg --backend stream
+
+Draw clearance gaps as a few merged paths instead of an element per item:
+    pcbscript draw -i 1.pcbs -o 1.svg --merge-gaps
+
+Prepare a picture drawing it right at the given DPI (no SVG in between):
+    pcbscript prepare -i 1.pcbs -o 1.jpg --dpi 1200 --backend raster
+
+The same for a huge board, by strips of 512 pixels in 4 processes:
+    pcbscript prepare -i 1.pcbs -o 1.png --dpi 2400 --backend raster \
+        --strip 512 --workers 4
+
+Drop duplicate items and merge collinear wires before drawing:
+    pcbscript draw -i 1.pcbs -o 1.svg --normalize
+
+Export the copper layer into Gerber RS-274X:
+    pcbscript gerber -i 1.pcbs -o 1.gbr
+
+Check design rules (JSON lines to stdout, exit code 1 if any violation):
+    pcbscript check -i 1.pcbs --min-width 0.1 --min-drill 0.1
+
+List electrical nets (JSON lines, pins connected to nothing are flagged):
+    pcbscript nets -i 1.pcbs -o 1.nets
+
+Profile the execution by source lines (the slowest first, --sort changes
+it), as JSON or as collapsed stacks of macro calls for a flame graph:
+    pcbscript profile -i 1.pcbs
+    pcbscript profile -i 1.pcbs -o 1.json --report json --sort count
+    pcbscript profile -i 1.pcbs -o 1.folded --report collapsed
+
+Keep pcbscript running in the background, so the next calls (the same
+command lines) are executed by it without starting and importing again:
+    pcbscript serve &
+    pcbscript draw -i 1.pcbs -o 1.svg
+
+Draw many files into a directory in 8 processes (inputs can also be listed
+in a manifest file with --manifest):
+    pcbscript draw -i boards/*.pcbs -d out -j 8
 """
 
+import os
+import sys
+import json
+import signal
 import argparse
 import traceback
-from time import sleep
+from time import time
 
-from .compiler import Compiler
+from .compiler import Compiler, ENGINES
+from .values import ExpressionError
+from .budget import BudgetError
+from .profiler import SORT_KEYS
 from .items import serialize
-from .drawer import Drawer
+from .itemfile import (EXTENSION as ITEMS_EXTENSION, ItemFileError,
+                       save_items, load_items)
+from .normalize import normalize as normalize_items
+from .backends import get_backend
+from .cache import CompileCache
+from .drc import check as check_rules
+from .nets import find_nets, is_unconnected
+from .daemon import Daemon, DaemonError, default_socket_path, request
 from .version import __version__
 
 
-def get_args():
+# Backends of draw and prepare (see backends module), they are imported
+# only when they are used
+DRAWERS = ['svgwrite', 'stream', 'raster']
+
+
+# Incremental compilers by inputs and options, kept warm by the daemon
+_warm_compilers = None
+
+
+def get_args(argv=None):
     parser = argparse.ArgumentParser()
     parser.add_argument('action',
-                        choices=['version', 'compile', 'draw', 'prepare'])
-    parser.add_argument('--input', '-i')
+                        choices=['version', 'compile', 'draw', 'prepare',
+                                 'gerber', 'check', 'nets', 'profile',
+                                 'serve'])
+    parser.add_argument('--input', '-i', nargs='+', default=[])
     parser.add_argument('--output', '-o')
+    parser.add_argument('--output-dir', '-d')
+    parser.add_argument('--manifest')
+    parser.add_argument('--suffix')
+    parser.add_argument('--jobs', '-j', type=int, default=1)
     parser.add_argument('--watch', action='store_true')
     parser.add_argument('--dpi', type=int, default=300)
     parser.add_argument('--format', choices=['A4'], default='A4')
     parser.add_argument('--offset', default='0,0')
     parser.add_argument('--coef', type=float, default=1.0)
-    args = parser.parse_args()
+    parser.add_argument('--engine', choices=ENGINES, default='interpreter')
+    parser.add_argument('--no-batch', action='store_true')
+    parser.add_argument('--inline', action='store_true')
+    parser.add_argument('--no-optimize', action='store_true')
+    parser.add_argument('--max-steps', type=int)
+    parser.add_argument('--max-items', type=int)
+    parser.add_argument('--timeout', type=float)
+    parser.add_argument('--backend', choices=DRAWERS,
+                        default='svgwrite')
+    parser.add_argument('--strip', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--merge-gaps', action='store_true')
+    parser.add_argument('--normalize', action='store_true')
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--cache-dir')
+    parser.add_argument('--cache-size', type=int, default=256)
+    parser.add_argument('--clearance', type=float)
+    parser.add_argument('--min-width', type=float, default=0.1)
+    parser.add_argument('--min-drill', type=float, default=0.1)
+    parser.add_argument('--min-ring', type=float, default=0.05)
+    parser.add_argument('--sort', choices=list(SORT_KEYS), default='time')
+    parser.add_argument('--report', choices=['table', 'json', 'collapsed'],
+                        default='table')
+    parser.add_argument('--socket')
+    parser.add_argument('--no-daemon', action='store_true')
+    args = parser.parse_args(argv)
+
+    # Strips are rendered by the raster backend only
+    if (args.strip or args.workers != 1) and \
+            (args.backend != 'raster' or
+             args.action not in ('draw', 'prepare')):
+        parser.error("--strip and --workers work only with draw and prepare "
+                     "and --backend raster")
+
+    # Merged gaps are compound paths of the SVG backends
+    if args.merge_gaps and \
+            (args.backend == 'raster' or
+             args.action not in ('draw', 'prepare')):
+        parser.error("--merge-gaps works only with draw and prepare and "
+                     "an SVG backend")
+
+    # Many inputs make a batch, otherwise input is a single path
+    args.inputs = args.input
+    args.input = args.input[0] if len(args.input) == 1 else None
+
     return args
 
 
@@ -42,60 +179,160 @@ def get_code(path):
         return f.read()
 
 
+def get_items(args, compiler, file=None):
+    # Compiled items are loaded from a binary file, they are only
+    # normalized if asked
+    if args.input.endswith(ITEMS_EXTENSION):
+        print("Loading items...", file=file)
+        try:
+            items = load_items(args.input)
+        except ItemFileError as exc:
+            raise SystemExit(f"Error: {exc}")
+        if compiler.normalize:
+            items, report = normalize_items(items)
+            print_normalize_report(report, file=file)
+        return items
+
+    print("Fetching code...", file=file)
+    code = get_code(args.input)
+
+    cache = get_cache(args)
+    if cache is not None:
+        key = cache.key(code, engine=compiler.engine, batch=compiler.batch,
+                        trace=compiler.trace, normalize=compiler.normalize,
+                        inline=compiler.inline, optimize=compiler.optimize,
+                        max_steps=compiler.max_steps,
+                        max_items=compiler.max_items)
+        items = cache.load(key)
+        if items is not None:
+            print("Loaded from cache", file=file)
+            return items
+
+    print("Compiling...", file=file)
+    try:
+        items = compiler.compile(code)
+    except (BudgetError, ExpressionError) as exc:
+        raise SystemExit(f"Error: {exc}")
+    print_report(compiler, file=file)
+
+    if cache is not None:
+        try:
+            cache.store(key, items)
+        except OSError as exc:
+            print(f"Cache is not saved: {exc}", file=file)
+
+    return items
+
+
+def get_cache(args):
+    if args.no_cache:
+        return None
+    return CompileCache(args.cache_dir, args.cache_size * 1024 * 1024)
+
+
+def get_compiler(args, **kwargs):
+    options = dict(engine=args.engine, batch=not args.no_batch,
+                   normalize=args.normalize, inline=args.inline,
+                   optimize=not args.no_optimize, **get_limits(args),
+                   **kwargs)
+    if _warm_compilers is None or 'incremental' in options:
+        return Compiler(**options)
+
+    key = (os.path.abspath(args.input or ''), tuple(sorted(options.items())))
+    compiler = _warm_compilers.get(key)
+    if compiler is None:
+        compiler = Compiler(incremental=True, **options)
+        _warm_compilers[key] = compiler
+    return compiler
+
+
+def get_limits(args):
+    return dict(max_steps=args.max_steps, max_items=args.max_items,
+                timeout=args.timeout)
+
+
+def print_report(compiler, file=None):
+    report = compiler.optimize_report
+    if report is not None:
+        print(f"Optimized: {report.before} -> {report.after} nodes",
+              file=file)
+
+    if compiler.report is not None:
+        print_normalize_report(compiler.report, file=file)
+
+
+def print_normalize_report(report, file=None):
+    print(f"Normalized: {report.pins} pins, {report.pinqs} pinqs, "
+          f"{report.texts} texts and {report.wires} wires duplicated, "
+          f"{report.merged} wires merged", file=file)
+
+
+def get_drawer(args, **kwargs):
+    if args.backend == 'raster':
+        kwargs.update(strip=args.strip, workers=args.workers)
+    else:
+        kwargs.update(merge_gaps=args.merge_gaps)
+    return get_backend(args.backend)(**kwargs)
+
+
 def version(args):
     print(__version__)
 
 
 def compile_(args):
-    print("Fetching code...")
-    code = get_code(args.input)
-
-    print("Compiling...")
-    compiler = Compiler()
-    items = compiler.compile(code)
+    items = get_items(args, get_compiler(args))
 
     print("Saving result...")
-    with open(args.output, 'w') as f:
-        for item in items:
-            print(serialize(item), file=f)
+    if args.output.endswith(ITEMS_EXTENSION):
+        save_items(items, args.output)
+    else:
+        with open(args.output, 'w') as f:
+            for item in items:
+                print(serialize(item), file=f)
 
     print("Completed")
 
 
 def draw(args):
+    if args.watch and args.input.endswith(ITEMS_EXTENSION):
+        raise SystemExit("watch needs a script, not compiled items")
+
     if args.watch:
+        # Imported here, as ctypes is needed by watch mode only
+        from .watcher import create_watcher
+
         print("Watching...")
 
-        compiler = Compiler()
-        drawer = Drawer()
+        compiler = get_compiler(args, incremental=True)
+        drawer = get_drawer(args)
         last_code = None
+        last_items = None
+
+        watcher = create_watcher([args.input])
 
         while True:
+            started = time()
             code = get_code(args.input)
             if code != last_code:
                 try:
                     items = compiler.compile(code)
-                    drawer.draw(items)
-                    drawer.save(args.output)
-                    print("Updated")
+                    if items is not last_items:
+                        drawer.draw(items)
+                        drawer.save(args.output)
+                        last_items = items
+                    print(f"Updated in {time() - started:.3f}s")
                 except:
                     print("Error")
                     traceback.print_exc()
                 finally:
                     last_code = code
-            else:
-                sleep(0.1)
+            watcher.wait()
 
     else:
-        print("Fetching code...")
-        code = get_code(args.input)
-
-        print("Compiling...")
-        compiler = Compiler()
-        items = compiler.compile(code)
+        items = get_items(args, get_compiler(args))
 
         print("Drawing...")
-        drawer = Drawer()
+        drawer = get_drawer(args)
         drawer.draw(items)
 
         print("Saving result...")
@@ -105,15 +342,12 @@ def draw(args):
 
 
 def prepare(args):
-    print("Fetching code...")
-    code = get_code(args.input)
-
-    print("Compiling...")
-    compiler = Compiler()
-    items = compiler.compile(code)
+    items = get_items(args, get_compiler(args))
 
     print("Drawing...")
-    drawer = Drawer(color=(255, 255, 255), bg_color=(0, 0, 0))
+    drawer = get_drawer(args, color=(255, 255, 255), bg_color=(0, 0, 0))
+    if not hasattr(drawer, 'prepare_a4'):
+        raise SystemExit(f"backend {args.backend} cannot prepare a sheet")
     drawer.draw(items)
 
     print("Saving result...")
@@ -123,10 +357,252 @@ def prepare(args):
     print("Completed")
 
 
-def main():
-    args = get_args()
+def gerber(args):
+    items = get_items(args, get_compiler(args))
+
+    print("Saving result...")
+    drawer = get_backend('gerber')()
+    drawer.draw(items)
+    drawer.save(args.output)
+
+    print("Completed")
 
-    if args.action == 'version':
+
+def check(args):
+    # Progress goes to stderr, so stdout can be the report
+    compiler = Compiler(engine=args.engine, trace=True, inline=args.inline,
+                        optimize=not args.no_optimize, **get_limits(args))
+    items = get_items(args, compiler, file=sys.stderr)
+
+    print("Checking...", file=sys.stderr)
+    violations = check_rules(items, clearance=args.clearance,
+                             min_width=args.min_width,
+                             min_drill=args.min_drill,
+                             min_ring=args.min_ring)
+
+    f = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        for violation in violations:
+            print(json.dumps(violation._asdict()), file=f)
+    finally:
+        if f is not sys.stdout:
+            f.close()
+
+    print(f"Violations: {len(violations)}", file=sys.stderr)
+    if violations:
+        raise SystemExit(1)
+
+
+def nets(args):
+    compiler = Compiler(engine=args.engine, trace=True, inline=args.inline,
+                        optimize=not args.no_optimize, **get_limits(args))
+    items = get_items(args, compiler, file=sys.stderr)
+
+    print("Finding nets...", file=sys.stderr)
+    found = find_nets(items)
+    columns = {'pin': items.pins, 'pinq': items.pinqs}
+    lines = getattr(items, 'lines', None)
+
+    unconnected = 0
+    f = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        for number, net in enumerate(found, 1):
+            pins = [
+                {
+                    'kind': kind,
+                    'line': lines[kind][index] or None if lines else None,
+                    'x': columns[kind][0][index],
+                    'y': columns[kind][1][index],
+                }
+                for kind, index in net.pins
+            ]
+            if is_unconnected(net):
+                unconnected += 1
+            print(json.dumps({
+                'net': number,
+                'pins': pins,
+                'wires': len(net.wires),
+                'unconnected': is_unconnected(net),
+            }), file=f)
+    finally:
+        if f is not sys.stdout:
+            f.close()
+
+    print(f"Nets: {len(found)}", file=sys.stderr)
+    print(f"Unconnected pins: {unconnected}", file=sys.stderr)
+
+
+def is_batch(args):
+    return len(args.inputs) > 1 or args.output_dir is not None or \
+        args.manifest is not None
+
+
+def run_batch(args):
+    # Imported here, as multiprocessing is needed by batches only
+    from .runner import read_manifest, run_jobs
+
+    action, suffix = BATCH_ACTIONS.get(args.action, (None, None))
+    if action is None:
+        raise SystemExit(f"{args.action} does not support many inputs")
+    if args.watch:
+        raise SystemExit("watch does not support many inputs")
+    if args.output:
+        raise SystemExit("output does not support many inputs, use "
+                         "--output-dir and --suffix")
+
+    jobs = [(path, None) for path in args.inputs]
+    if args.manifest:
+        jobs.extend(read_manifest(args.manifest))
+
+    # Outputs are in the output directory
+    output_dir = args.output_dir or '.'
+    suffix = args.suffix or suffix
+    jobs = [
+        (
+            path,
+            os.path.join(output_dir, output or os.path.splitext(
+                os.path.basename(path)
+            )[0] + suffix),
+        )
+        for path, output in jobs
+    ]
+    outputs = [output for _, output in jobs]
+    if len(set(outputs)) < len(outputs):
+        raise SystemExit("several inputs have the same output")
+    os.makedirs(output_dir, exist_ok=True)
+
+    processes = args.jobs if args.jobs > 0 else os.cpu_count()
+    print(f"Running {len(jobs)} files in {processes} processes...")
+
+    started = time()
+    results = []
+    for result in run_jobs(action, args, jobs, processes):
+        status = 'failed' if result.error else 'ok'
+        print(f"{result.time:8.3f}s  {status:6}  {result.input}")
+        results.append(result)
+
+    failed = [result for result in results if result.error]
+    if failed:
+        print("Failures:")
+        for result in failed:
+            print(f"    {result.input}: {result.error}")
+    print(f"Completed {len(results) - len(failed)} of {len(results)} "
+          f"files in {time() - started:.3f}s")
+
+    if failed:
+        raise SystemExit(1)
+
+
+def profile(args):
+    # Progress goes to stderr, so stdout can be the report
+    if args.input.endswith(ITEMS_EXTENSION):
+        raise SystemExit("profile needs a script, not compiled items")
+
+    print("Fetching code...", file=sys.stderr)
+    code = get_code(args.input)
+
+    print("Profiling...", file=sys.stderr)
+    compiler = Compiler(inline=args.inline, optimize=not args.no_optimize,
+                        profile=True, **get_limits(args))
+    try:
+        items = compiler.compile(code)
+    except (BudgetError, ExpressionError) as exc:
+        raise SystemExit(f"Error: {exc}")
+    report = compiler.profile_report
+    sources = code.split('\n')
+
+    f = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        if args.report == 'json':
+            json.dump(report.to_json(args.sort, sources), f, indent=2)
+            print(file=f)
+        elif args.report == 'collapsed':
+            root = os.path.basename(args.input)
+            for line in report.collapsed(root, sources):
+                print(line, file=f)
+        else:
+            print(f"{'line':>6} {'count':>9} {'time ms':>10} "
+                  f"{'eval ms':>10} {'items':>9}  source", file=f)
+            for row in report.rows(args.sort):
+                source = sources[row.line - 1].strip() if row.line else ''
+                print(f"{row.line or '':>6} {row.count:>9} "
+                      f"{row.time * 1e3:>10.3f} {row.eval_time * 1e3:>10.3f} "
+                      f"{row.items:>9}  {source}", file=f)
+    finally:
+        if f is not sys.stdout:
+            f.close()
+
+    print(f"Time: {report.time * 1e3:.3f} ms, items: {len(items)}",
+          file=sys.stderr)
+
+
+def serve(args):
+    global _warm_compilers
+    _warm_compilers = {}
+
+    path = args.socket or default_socket_path()
+    try:
+        daemon = Daemon(path, execute)
+    except OSError as exc:
+        raise SystemExit(str(exc))
+
+    # The socket is removed on exit
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    print(f"Serving on {path}...")
+    with daemon:
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def execute(argv):
+    run(get_args(argv))
+
+
+# Actions that support many inputs and suffixes of their outputs
+BATCH_ACTIONS = {
+    'compile': (compile_, '.txt'),
+    'draw': (draw, '.svg'),
+    'prepare': (prepare, '.png'),
+    'gerber': (gerber, '.gbr'),
+}
+
+
+def main():
+    argv = sys.argv[1:]
+
+    # Sending the command line to the daemon if it is running
+    if not {'serve', '--watch', '--no-daemon'} & set(argv):
+        try:
+            response = request(argv, _find_socket(argv))
+        except DaemonError as exc:
+            raise SystemExit(f"Error: daemon did not finish the command "
+                             f"({exc}); rerun with --no-daemon")
+        if response is not None:
+            stdout, stderr, code = response
+            sys.stdout.write(stdout)
+            sys.stderr.write(stderr)
+            raise SystemExit(code)
+
+    run(get_args(argv))
+
+
+def _find_socket(argv):
+    # Both --socket PATH and --socket=PATH
+    for index, arg in enumerate(argv):
+        if arg == '--socket' and index + 1 < len(argv):
+            return argv[index + 1]
+        if arg.startswith('--socket='):
+            return arg.split('=', 1)[1]
+    return None
+
+
+def run(args):
+    if is_batch(args):
+        run_batch(args)
+    elif args.action == 'version':
         version(args)
     elif args.action == 'compile':
         compile_(args)
@@ -134,6 +610,16 @@ def main():
         draw(args)
     elif args.action == 'prepare':
         prepare(args)
+    elif args.action == 'gerber':
+        gerber(args)
+    elif args.action == 'check':
+        check(args)
+    elif args.action == 'nets':
+        nets(args)
+    elif args.action == 'profile':
+        profile(args)
+    elif args.action == 'serve':
+        serve(args)
 
 
 if __name__ == "__main__":
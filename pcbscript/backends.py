@@ -0,0 +1,45 @@
+"""
+Registry of output backends. A backend is a class of drawer (draw(items),
+save(path)) registered by name together with the module it lives in, so
+the module and the libraries it needs (svgwrite, CairoSVG, Pillow) are
+imported only when the backend is used, not when pcbscript starts.
+
+A new exporter is added by one more register_backend call:
+    register_backend('dxf', 'pcbscript.dxfdrawer:DxfDrawer')
+"""
+
+import importlib
+
+
+_BACKENDS = {}
+
+
+def register_backend(name, path):
+    """
+    Registers a backend by the path 'module:Class' (the module can be
+    relative to pcbscript, like '.drawer').
+    """
+    _BACKENDS[name] = path
+
+
+def get_backend(name):
+    """
+    Imports the module of the backend and returns its class.
+    """
+    try:
+        path = _BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"unknown backend: {name}") from None
+    module_name, class_name = path.split(':')
+    module = importlib.import_module(module_name, __package__)
+    return getattr(module, class_name)
+
+
+def backend_names():
+    return list(_BACKENDS)
+
+
+register_backend('svgwrite', '.drawer:Drawer')
+register_backend('stream', '.streamdrawer:StreamDrawer')
+register_backend('raster', '.rasterdrawer:RasterDrawer')
+register_backend('gerber', '.gerberdrawer:GerberDrawer')
@@ -0,0 +1,247 @@
+"""
+Batch evaluation of simple for-loops. A loop is simple if:
+    * its bound is a plain "i >= <expr>" where <expr> does not depend on i;
+    * its body consists of pin, pinq and wire nodes only;
+    * all the expressions of the body are affine in the loop variable.
+Such a loop is replaced by BatchForNode that evaluates all the iterations
+at once: the loop variable becomes a NumPy array of the iteration values
+and each expression is evaluated once for the whole array. The array holds
+Python numbers (dtype=object), so the arithmetic is exactly the one of the
+interpreter, and the resulting columns go straight into ItemBuffer.
+If a batch evaluation fails for any reason (or the loop is too short to
+win anything, or it would exceed the budget), the loop is executed by the
+interpreter as usual. NumPy is optional: without it no loop is batched.
+"""
+
+import ast
+import importlib.util
+
+from .nodes import *
+from .values import GLOBALS, compile_expr
+from .budget import Budget, BudgetError
+
+
+# NumPy is imported by the first batch evaluation, so compiling a script
+# without long loops does not pay for importing it
+HAS_NUMPY = importlib.util.find_spec('numpy') is not None
+
+
+# Short loops are faster in the interpreter than in NumPy
+MIN_BATCH_SIZE = 32
+
+
+class BatchForNode(BaseNode):
+    def __init__(self, assign, bound, body, jmp, budget=None):
+        self.assign = assign
+        self.bound = bound
+        self.body = body
+        self.jmp = jmp
+        self.budget = budget
+
+    def exec(self, items, scope, motion_stack, macro_stack, options):
+        if self.exec_batch(items, scope, motion_stack, options):
+            return self.jmp
+        self.assign.exec(items, scope, motion_stack, macro_stack, options)
+
+    def lower(self, items, scope, motion_stack, macro_stack, options):
+        # Closure returns True if the whole loop has been executed
+        def run():
+            return self.exec_batch(items, scope, motion_stack, options)
+
+        return run
+
+    def exec_batch(self, items, scope, motion_stack, options):
+        var_name = self.assign.var_name
+        budget = self.budget
+        limit = self._max_size()
+
+        try:
+            value = self.assign.expr.eval(scope)
+            bound = eval(self.bound, GLOBALS, scope)
+            values = []
+            while not value >= bound:
+                values.append(value)
+                value = value + 1
+                if budget is not None and \
+                        not len(values) % Budget.CHECK_INTERVAL:
+                    budget.check()
+                    if limit is not None and len(values) > limit:
+                        return False
+
+            if len(values) < MIN_BATCH_SIZE or \
+                    limit is not None and len(values) > limit:
+                return False
+
+            import numpy as np
+
+            scope[var_name] = np.empty(len(values), dtype=object)
+            scope[var_name][:] = values
+            columns = {}
+            for node in self.body:
+                self._eval_body_node(node, scope, motion_stack, options,
+                                     columns)
+        except BudgetError:
+            scope.pop(var_name, None)
+            raise
+        except Exception:
+            scope.pop(var_name, None)
+            return False
+
+        scope[var_name] = value
+
+        # Interleaving the columns of the nodes of the same kind,
+        # so the items go in the order of iterations
+        for kind, node_columns in columns.items():
+            for target, column in zip(getattr(items, kind),
+                                      zip(*node_columns)):
+                target.extend(np.stack([
+                    np.broadcast_to(np.array(part, dtype=object),
+                                    (len(values),))
+                    for part in column
+                ], axis=1).ravel().tolist())
+
+        # The steps of the iterations and of the last check of the bound
+        if budget is not None:
+            budget.spend(len(values) * (len(self.body) + 3) + 1)
+
+        return True
+
+    def _max_size(self):
+        # Most iterations that do not exceed the budget, None if no limit
+        if self.budget is None:
+            return None
+
+        limits = []
+        steps = self.budget.steps_left()
+        if steps is not None:
+            limits.append((steps - 1) // (len(self.body) + 3))
+        items = self.budget.items_left()
+        if items is not None:
+            per_iteration = sum(len(node.coords) - 1
+                                if isinstance(node, WireNode) else 1
+                                for node in self.body)
+            limits.append(items // max(per_iteration, 1))
+        return min(limits) if limits else None
+
+    @classmethod
+    def _eval_body_node(cls, node, scope, motion_stack, options, columns):
+        if isinstance(node, WireNode):
+            width = cls._get_value_or_option(node.width, 'WIRE_WIDTH',
+                                             scope, options)
+            points = [cls._eval_coord(coord, scope, motion_stack)
+                      for coord in node.coords]
+            for (x1, y1), (x2, y2) in zip(points[:-1], points[1:]):
+                columns.setdefault('wires', []).append(
+                    (x1, y1, x2, y2, width)
+                )
+        else:
+            x, y = cls._eval_coord(node.coord, scope, motion_stack)
+            dout = cls._get_value_or_option(node.dout, 'PIN_DOUT',
+                                            scope, options)
+            din = cls._get_value_or_option(node.din, 'PIN_DIN',
+                                           scope, options)
+            kind = 'pins' if isinstance(node, PinNode) else 'pinqs'
+            columns.setdefault(kind, []).append((x, y, dout, din))
+
+
+def batch_loops(nodes, budget=None):
+    """
+    Replaces the first node of every simple for-loop with BatchForNode.
+    The indices of all other nodes stay the same, so the jumps stay valid.
+    Batch nodes spend the steps of their iterations from the budget.
+    """
+    if not HAS_NUMPY:
+        return nodes
+
+    for index, node in enumerate(nodes):
+        loop = _match_loop(nodes, index, budget)
+        if loop is not None:
+            nodes[index] = loop
+
+    return nodes
+
+
+def _match_loop(nodes, index, budget):
+    if index + 1 >= len(nodes):
+        return None
+
+    assign, jmp = nodes[index], nodes[index + 1]
+    if type(assign) is not AssignNode or type(jmp) is not JmpNode or \
+            jmp.expr is None or jmp.jmp is None or jmp.jmp < index + 4:
+        return None
+
+    back = nodes[jmp.jmp - 1]
+    increment = nodes[jmp.jmp - 2]
+    if type(back) is not JmpNode or back.jmp != index + 1 or \
+            type(increment) is not AssignNode or \
+            increment.var_name != assign.var_name:
+        return None
+
+    var_name = assign.var_name
+    body = nodes[index + 2:jmp.jmp - 2]
+
+    bound = _match_bound(jmp.expr.value, var_name)
+    if bound is None:
+        return None
+
+    for node in body:
+        if type(node) in (PinNode, PinqNode):
+            exprs = [node.coord.x, node.coord.y,
+                     node.dout.value, node.din.value]
+        elif type(node) is WireNode:
+            exprs = [node.width.value]
+            for coord in node.coords:
+                exprs.extend([coord.x, coord.y])
+        else:
+            return None
+
+        for expr in exprs:
+            tree = ast.parse(expr.strip(), mode='eval')
+            if _degree(tree.body, var_name) is None:
+                return None
+
+    return BatchForNode(assign, bound, body, jmp.jmp, budget)
+
+
+def _match_bound(expr, var_name):
+    tree = ast.parse(expr.strip(), mode='eval').body
+    if not isinstance(tree, ast.Compare) or len(tree.ops) != 1 or \
+            not isinstance(tree.ops[0], ast.GtE) or \
+            not isinstance(tree.left, ast.Name) or tree.left.id != var_name:
+        return None
+
+    bound = tree.comparators[0]
+    if _degree(bound, var_name) != 0:
+        return None
+
+    return compile_expr(ast.unparse(bound))
+
+
+def _degree(tree, var_name):
+    # Degree of the expression in the loop variable: 0 for invariants,
+    # 1 for affine expressions and None for anything else
+    if isinstance(tree, ast.Constant):
+        if tree.value is None or type(tree.value) in (int, float):
+            return 0
+        return None
+
+    if isinstance(tree, ast.Name):
+        return 1 if tree.id == var_name else 0
+
+    if isinstance(tree, ast.UnaryOp) and \
+            isinstance(tree.op, (ast.UAdd, ast.USub)):
+        return _degree(tree.operand, var_name)
+
+    if isinstance(tree, ast.BinOp):
+        left = _degree(tree.left, var_name)
+        right = _degree(tree.right, var_name)
+        if left is None or right is None:
+            return None
+        if isinstance(tree.op, (ast.Add, ast.Sub)):
+            return max(left, right)
+        if isinstance(tree.op, ast.Mult) and left + right <= 1:
+            return left + right
+        if isinstance(tree.op, ast.Div) and right == 0:
+            return left
+
+    return None
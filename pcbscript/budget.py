@@ -0,0 +1,67 @@
+"""
+Budget limits the execution of a script: the number of executed nodes
+(steps), the number of emitted items and the wall time. A script that
+exceeds any of them is stopped with BudgetError, so a runaway loop cannot
+hold a process (like a worker of a rendering service) forever.
+
+Executors spend a step for every node they execute (an ExitNode is not
+counted), batch loops spend the steps their iterations would take in the
+interpreter, so the count is the same for every engine. Steps are checked
+right away, the items and the time every CHECK_INTERVAL steps and once
+more in the end.
+"""
+
+from time import monotonic
+
+
+class BudgetError(Exception):
+    pass
+
+
+class Budget:
+    # Steps between two checks of the items and the time
+    CHECK_INTERVAL = 1024
+
+    def __init__(self, max_steps=None, max_items=None, timeout=None):
+        self.max_steps = max_steps
+        self.max_items = max_items
+        self.timeout = timeout
+        self.steps = 0
+        self._items = None
+        self._deadline = None
+        self._check_at = 0
+
+    def start(self, items):
+        self.steps = 0
+        self._items = items
+        if self.timeout is not None:
+            self._deadline = monotonic() + self.timeout
+        self._check_at = 0
+        self.check()
+
+    def spend(self, steps=1):
+        self.steps += steps
+        if self.steps >= self._check_at:
+            self.check()
+
+    def steps_left(self):
+        if self.max_steps is None:
+            return None
+        return self.max_steps - self.steps
+
+    def items_left(self):
+        if self.max_items is None:
+            return None
+        return self.max_items - len(self._items)
+
+    def check(self):
+        if self.max_steps is not None and self.steps > self.max_steps:
+            raise BudgetError(f"more than {self.max_steps} steps executed")
+        if self.max_items is not None and len(self._items) > self.max_items:
+            raise BudgetError(f"more than {self.max_items} items emitted")
+        if self._deadline is not None and monotonic() > self._deadline:
+            raise BudgetError(f"time limit of {self.timeout} s exceeded")
+
+        self._check_at = self.steps + self.CHECK_INTERVAL
+        if self.max_steps is not None:
+            self._check_at = min(self._check_at, self.max_steps + 1)
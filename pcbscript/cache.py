@@ -0,0 +1,99 @@
+"""
+On-disk cache of compiled items shared by all the runs of pcbscript.
+Entries are binary item files (see itemfile) named by a SHA-256 hash of
+the source code, the version of pcbscript and the options of compilation,
+so an entry is never stale: any change makes another key.
+
+The cache is limited by the total size of the entries. Every hit touches
+the entry, and after a new entry is stored, the least recently used
+entries are removed until the cache fits the limit.
+"""
+
+import os
+import hashlib
+import tempfile
+
+from .itemfile import EXTENSION, ItemFileError, write_items, load_items
+from .version import __version__
+
+
+DEFAULT_SIZE = 256 * 1024 * 1024
+
+
+def default_path():
+    base = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'pcbscript')
+
+
+class CompileCache:
+    def __init__(self, path=None, max_size=DEFAULT_SIZE):
+        self.path = path or default_path()
+        self.max_size = max_size
+
+    def key(self, code, **options):
+        digest = hashlib.sha256()
+        digest.update(__version__.encode())
+        for name, value in sorted(options.items()):
+            digest.update(f"\0{name}={value!r}".encode())
+        digest.update(b'\0')
+        digest.update(code.encode())
+        return digest.hexdigest()
+
+    def load(self, key):
+        """
+        Returns the cached items or None.
+        """
+        path = self._entry_path(key)
+        try:
+            items = load_items(path)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, ItemFileError):
+            self._remove(path)
+            return None
+        return items
+
+    def store(self, key, items):
+        os.makedirs(self.path, exist_ok=True)
+
+        # Writing into a temporary file first, so a concurrent run never
+        # sees a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write_items(items, f)
+            os.replace(temp_path, self._entry_path(key))
+        except BaseException:
+            self._remove(temp_path)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        with os.scandir(self.path) as scan:
+            for entry in scan:
+                if entry.name.endswith(EXTENSION):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            self._remove(path)
+            total -= size
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key + EXTENSION)
+
+    @classmethod
+    def _remove(cls, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
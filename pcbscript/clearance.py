@@ -0,0 +1,123 @@
+"""
+Clearance outlines. With the GAP option every pin, pinq and wire is
+surrounded by a background-colored clearance shape, and the board gets
+a frame. Instead of an SVG element per shape, the shapes are grouped into
+clusters of shapes lying close to each other (a uniform grid is used as
+a spatial index, clusters are joined with union-find), and every cluster
+is drawn as one compound path. All subpaths go clockwise, so with
+the default nonzero fill rule a path covers exactly the union of its
+shapes. Circles are made of cubic Bezier curves, because arcs are not
+allowed in SVG Tiny.
+"""
+
+import math
+
+
+# Control point offset of a cubic Bezier quarter of a unit circle
+_KAPPA = 4 * (math.sqrt(2) - 1) / 3
+
+
+def clearance_paths(items, gap, scale, cell=1.0):
+    """
+    Yields SVG path data of clearance regions, one per cluster.
+    """
+    shapes = list(_shapes(items, gap))
+    for cluster in _clusters([bbox for bbox, _ in shapes], cell):
+        yield ''.join(_subpath(shapes[index][1], scale) for index in cluster)
+
+
+def frame_path(board, scale):
+    """
+    SVG path data of the frame of the board (outer rectangle clockwise and
+    inner one counterclockwise, so the inside is a hole).
+    """
+    width = board.width * scale
+    height = board.height * scale
+    gap = board.gap * scale
+    return 'M0,0L%.2f,0L%.2f,%.2fL0,%.2fZ' % (width, width, height, height) + \
+        'M%.2f,%.2fL%.2f,%.2fL%.2f,%.2fL%.2f,%.2fZ' % (
+            gap, gap, gap, height - gap,
+            width - gap, height - gap, width - gap, gap,
+        )
+
+
+def _shapes(items, gap):
+    # Shapes are ('circle', x, y, r) and ('polygon', points)
+    # along with their bounding boxes
+    for x1, y1, x2, y2, width in zip(*items.wires):
+        r = 0.5 * width + gap
+        length = math.hypot(x2 - x1, y2 - y1)
+        if length:
+            nx = (y1 - y2) / length * r
+            ny = (x2 - x1) / length * r
+            points = [(x1 + nx, y1 + ny), (x2 + nx, y2 + ny),
+                      (x2 - nx, y2 - ny), (x1 - nx, y1 - ny)]
+            yield _bbox(points), ('polygon', _clockwise(points))
+        for x, y in ((x1, y1), (x2, y2)):
+            yield (x - r, y - r, x + r, y + r), ('circle', x, y, r)
+
+    for x, y, dout, din in zip(*items.pins):
+        r = 0.5 * dout + gap
+        yield (x - r, y - r, x + r, y + r), ('circle', x, y, r)
+
+    for x, y, dout, din in zip(*items.pinqs):
+        h = 0.5 * dout + gap
+        points = [(x - h, y - h), (x + h, y - h), (x + h, y + h),
+                  (x - h, y + h)]
+        yield (x - h, y - h, x + h, y + h), ('polygon', points)
+
+
+def _clusters(bboxes, cell):
+    # Shapes sharing a cell of the grid are joined into one cluster
+    parent = list(range(len(bboxes)))
+
+    def find(index):
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    grid = {}
+    for index, (x1, y1, x2, y2) in enumerate(bboxes):
+        for i in range(math.floor(x1 / cell), math.floor(x2 / cell) + 1):
+            for j in range(math.floor(y1 / cell), math.floor(y2 / cell) + 1):
+                other = grid.setdefault((i, j), index)
+                parent[find(other)] = find(index)
+
+    clusters = {}
+    for index in range(len(bboxes)):
+        clusters.setdefault(find(index), []).append(index)
+    return clusters.values()
+
+
+def _subpath(shape, scale):
+    if shape[0] == 'circle':
+        _, x, y, r = shape
+        x, y, r = x * scale, y * scale, r * scale
+        k = r * _KAPPA
+        return 'M%.2f,%.2f' % (x + r, y) + \
+            'C%.2f,%.2f %.2f,%.2f %.2f,%.2f' % (x + r, y + k, x + k, y + r,
+                                                x, y + r) + \
+            'C%.2f,%.2f %.2f,%.2f %.2f,%.2f' % (x - k, y + r, x - r, y + k,
+                                                x - r, y) + \
+            'C%.2f,%.2f %.2f,%.2f %.2f,%.2f' % (x - r, y - k, x - k, y - r,
+                                                x, y - r) + \
+            'C%.2f,%.2f %.2f,%.2f %.2f,%.2fZ' % (x + k, y - r, x + r, y - k,
+                                                 x + r, y)
+    else:
+        points = shape[1]
+        return 'M' + 'L'.join('%.2f,%.2f' % (x * scale, y * scale)
+                              for x, y in points) + 'Z'
+
+
+def _bbox(points):
+    xs = [x for x, _ in points]
+    ys = [y for _, y in points]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def _clockwise(points):
+    # Clockwise on the screen (y goes down) means a positive shoelace sum
+    area = sum(x1 * y2 - x2 * y1
+               for (x1, y1), (x2, y2) in zip(points, points[1:] + points[:1]))
+    return points if area >= 0 else points[::-1]
@@ -15,6 +15,7 @@ class ParserError(Exception):
 
 
 class BaseCommand:
+    keyword = None
     regex = None
 
     def __init__(self, args, indent):
@@ -51,6 +52,7 @@ class BaseCommand:
 
 
 class ExitCommand(BaseCommand):
+    keyword = 'exit'
     regex = re.compile(r'^exit$')
 
     @classmethod
@@ -64,6 +66,7 @@ class ExitCommand(BaseCommand):
 
 
 class OptionCommand(BaseCommand):
+    keyword = 'option'
     regex = re.compile(r'^option\s+([a-zA-Z\_][a-zA-Z0-9\_]*)\s*=\s*(.*?)$')
 
     @classmethod
@@ -79,6 +82,7 @@ class OptionCommand(BaseCommand):
 
 
 class BoardCommand(BaseCommand):
+    keyword = 'board'
     regex = re.compile(r'^board\s+(.*?)$')
 
     @classmethod
@@ -94,6 +98,7 @@ class BoardCommand(BaseCommand):
 
 
 class PinCommand(BaseCommand):
+    keyword = 'pin'
     regex = re.compile(r'^pin\s+(.*?)$')
 
     @classmethod
@@ -119,6 +124,7 @@ class PinCommand(BaseCommand):
 
 
 class PinqCommand(BaseCommand):
+    keyword = 'pinq'
     regex = re.compile(r'^pinq\s+(.*?)$')
 
     @classmethod
@@ -144,6 +150,7 @@ class PinqCommand(BaseCommand):
 
 
 class WireCommand(BaseCommand):
+    keyword = 'wire'
     regex = re.compile(r'^wire\s+(.*?)$')
 
     @classmethod
@@ -171,6 +178,7 @@ class WireCommand(BaseCommand):
 
 
 class TextCommand(BaseCommand):
+    keyword = 'text'
     regex = re.compile(r'^text\s+\"(.*?)\"\s+(.*?)$')
 
     @classmethod
@@ -195,6 +203,7 @@ class TextCommand(BaseCommand):
 
 
 class VarCommand(BaseCommand):
+    keyword = 'var'
     regex = re.compile(r'^var\s+([a-zA-Z\_][a-zA-Z0-9\_]*)\s*=\s*(.*?)$')
 
     @classmethod
@@ -210,6 +219,7 @@ class VarCommand(BaseCommand):
 
 
 class IfCommand(BaseCommand):
+    keyword = 'if'
     regex = re.compile(r'^if\s+(.*?)\s*:$')
 
     @classmethod
@@ -240,6 +250,7 @@ class IfCommand(BaseCommand):
 
 
 class ElseCommand(BaseCommand):
+    keyword = 'else'
     regex = re.compile(r'^else\s*:$')
 
     @classmethod
@@ -257,6 +268,7 @@ class ElseCommand(BaseCommand):
 
 
 class ForCommand(BaseCommand):
+    keyword = 'for'
     regex = re.compile(
         r'^for\s+([a-zA-Z\_][a-zA-Z0-9\_]*)\s+in\s+(.*?)\.\.(.*?)\s*:$'
     )
@@ -301,6 +313,7 @@ class ForCommand(BaseCommand):
 
 
 class TranslationCommand(BaseCommand):
+    keyword = 'translate'
     regex = re.compile(r'translate\s+(.*?)\s*:$')
 
     @classmethod
@@ -322,6 +335,7 @@ class TranslationCommand(BaseCommand):
 
 
 class RotationCommand(BaseCommand):
+    keyword = 'rotate'
     regex = re.compile(r'rotate\s+(.*?)\s*:$')
 
     @classmethod
@@ -343,6 +357,7 @@ class RotationCommand(BaseCommand):
 
 
 class MarcoDefCommand(BaseCommand):
+    keyword = 'macro'
     regex = re.compile(
         r'macro\s+([a-zA-Z\_][a-zA-Z0-9\_]*)\s*\((.*?)\)\s*:$'
     )
@@ -392,10 +407,11 @@ class MarcoCallCommand(BaseCommand):
     def from_line(cls, line):
         indent = cls._get_indent(line)
         marco_name, args_str = cls.match(line).groups()
-        args = [String.from_str(marco_name)] + list(map(
+        args_str = args_str.strip()
+        args = [String.from_str(marco_name)] + (list(map(
             Number.from_str,
             map(str.strip, args_str.split(','))
-        ))
+        )) if args_str else [])
         return cls(args, indent)
 
     def exec_enter(self, nodes, indent_stack, macro_scope):
@@ -410,30 +426,34 @@ class MarcoCallCommand(BaseCommand):
 
         # Jump to the macro commands
         idx = len(nodes) + 1
-        node = MacroEnterNode(macro_scope[macro_name]['idx'], idx)
+        node = MacroEnterNode(macro_scope[macro_name]['idx'], idx,
+                              macro_name)
         nodes.append(node)
 
 
-command_classes = []
+keyword_regex = re.compile(r'[a-zA-Z\_][a-zA-Z0-9\_]*')
+command_table = {}
 
 
 def guess_command(line):
-    for command_cls in command_classes:
-        try:
-            command_cls.match(line)
-        except ValueError:
-            continue
-        else:
+    stripped = line.lstrip()
+    match = keyword_regex.match(stripped)
+    if match is not None:
+        command_cls = command_table.get(match.group(0))
+        if command_cls is not None and \
+                command_cls.regex.match(stripped) is not None:
             return command_cls.from_line(line)
+        if MarcoCallCommand.regex.match(stripped) is not None:
+            return MarcoCallCommand.from_line(line)
     raise ParserError(f"unknown expression: {line}")
 
 
-def _build_command_classes():
-    del command_classes[:]
+def _build_command_table():
+    command_table.clear()
     for obj in globals().values():
         if inspect.isclass(obj) and issubclass(obj, BaseCommand) and \
-                obj is not BaseCommand:
-            command_classes.append(obj)
+                obj.keyword is not None:
+            command_table[obj.keyword] = obj
 
 
-_build_command_classes()
+_build_command_table()
@@ -1,14 +1,51 @@
 """
-Compier manages all the process of compilation. There are 4 main steps:
+Compier manages all the process of compilation. There are 3 main steps:
     Step 1. Parsing the original code into a sequence of commands.
-    Step 2. Transform the commands into a graph of nodes.
-    Step 3. Execute the nodes.
-    Step 4. Sorting the final items according to their priority to draw.
+    Step 2. Transform the commands into a graph of nodes
+        (calls of macros are inlined if inline is set, the graph is
+        optimized if optimize is set, simple for-loops are replaced with
+        batch nodes if NumPy is present).
+    Step 3. Execute the nodes (by the interpreter or by the closure engine).
+Items are collected into ItemBuffer that keeps them by kind in the order
+they must be drawn, so no sorting is needed in the end.
+
+An incremental compiler (used in watch mode) remembers the commands parsed
+from every line, so only changed lines are parsed again, and it returns
+the previous items untouched if only comments or whitespace have changed.
+
+Every node knows the source line it comes from. A tracing compiler
+collects the items into TracedItemBuffer, so the line of every item is
+known too (it runs the interpreter without batch loops for that).
+
+With optimize (on by default) constants are folded and dead branches are
+dropped, the numbers of nodes before and after are kept in
+`optimize_report`.
+
+With normalize the items are normalized in the end (duplicates dropped,
+collinear wires merged), and the report is kept in `report`.
+
+A profiling compiler executes the nodes by Profiler (the interpreter loop
+with every node measured, without batch loops), the profile of the source
+lines is kept in `profile_report`.
+
+The execution can be limited by the number of executed nodes (max_steps),
+the number of items (max_items) and the wall time in seconds (timeout),
+BudgetError is raised if a limit is exceeded.
 """
 
 from .nodes import ExitNode
 from .items import *
 from .commands import guess_command
+from .engine import ClosureEngine
+from .batch import batch_loops
+from .budget import Budget
+from .profiler import Profiler
+from .inline import inline_macros
+from .optimize import optimize as optimize_nodes
+from .normalize import normalize as normalize_items
+
+
+ENGINES = ['interpreter', 'closure']
 
 
 class CompilerError(Exception):
@@ -16,41 +53,103 @@ class CompilerError(Exception):
 
 
 class Compiler:
+    def __init__(self, engine='interpreter', batch=True, incremental=False,
+                 trace=False, normalize=False, inline=False, optimize=True,
+                 max_steps=None, max_items=None, timeout=None,
+                 profile=False):
+        if engine not in ENGINES:
+            raise CompilerError(f"unknown engine: {engine}")
+        self.engine = engine
+        self.batch = batch
+        self.incremental = incremental
+        self.trace = trace
+        self.normalize = normalize
+        self.inline = inline
+        self.optimize = optimize
+        self.max_steps = max_steps
+        self.max_items = max_items
+        self.timeout = timeout
+        self.profile = profile
+        self.report = None
+        self.optimize_report = None
+        self.profile_report = None
+        self._command_cache = {}
+        self._last_lines = None
+        self._last_items = None
+
     def compile(self, code):
+        numbered_lines = list(self._numbered_lines(code))
+        lines = [line for _, line in numbered_lines]
+
+        # Nothing to do if the meaningful lines have not changed
+        if self.incremental and lines == self._last_lines:
+            return self._last_items
+
         # Step 1. Parsing: code -> commands
-        commands = self._parse_code(code)
+        commands = self._parse_lines(lines)
 
         # Step 2. Building execution nodes: commands -> nodes
-        nodes = self._build_graph(commands)
+        numbers = [number for number, _ in numbered_lines]
+        if self.inline:
+            commands, numbers = inline_macros(commands, numbers)
+        nodes = self._build_graph(commands, numbers)
+        if self.optimize:
+            nodes, self.optimize_report = optimize_nodes(nodes)
+        budget = self._budget()
+        if self.batch and not self.trace and not self.profile:
+            batch_loops(nodes, budget)
 
         # Step 3. Compilation: nodes -> items
-        items = self._exec_nodes(nodes)
+        items = self._exec_nodes(nodes, budget)
+        if self.normalize:
+            items, self.report = normalize_items(items)
 
-        # Step 4. Sorting items
-        self._sort_items(items)
+        if self.incremental:
+            self._last_lines = lines
+            self._last_items = items
 
         return items
 
     @classmethod
     def _cleaned_lines(cls, code):
-        for line in code.split('\n'):
+        for _, line in cls._numbered_lines(code):
+            yield line
+
+    @classmethod
+    def _numbered_lines(cls, code):
+        for number, line in enumerate(code.split('\n'), 1):
             line = line.split('#', 1)[0].rstrip()
             if line:
-                yield line
-        yield 'exit'
+                yield number, line
+        yield None, 'exit'
 
     def _parse_code(self, code):
+        return self._parse_lines(self._cleaned_lines(code))
+
+    def _parse_lines(self, lines):
         commands = []
-        for line in self._cleaned_lines(code):
-            command = guess_command(line)
+        for line in lines:
+            command = self._command_cache.get(line)
+            if command is None:
+                command = guess_command(line)
             commands.append(command)
+
+        # Keeping the commands of the current lines only
+        if self.incremental:
+            self._command_cache = dict(zip(lines, commands))
+
         return commands
 
-    def _build_graph(self, commands):
+    def _build_graph(self, commands, numbers=None):
         nodes = []
         indent_stack = []
         macro_scope = {}
 
+        # Source lines of the commands and of the open blocks
+        if numbers is None:
+            numbers = [None] * len(commands)
+        line_stack = []
+
         index = 0
 
         while index < len(commands):
@@ -63,20 +162,39 @@ class Compiler:
             # Process indent back
             if command.indent < len(indent_stack):
                 indent_idx, stack_command = indent_stack.pop()
+                start = len(nodes)
                 stack_command.exec_exit(nodes, indent_stack,
                                         macro_scope, indent_idx)
+                self._set_lines(nodes, start, line_stack.pop())
 
             # Process command
             else:
+                start = len(nodes)
+                depth = len(indent_stack)
                 command.exec_enter(nodes, indent_stack, macro_scope)
+                self._set_lines(nodes, start, numbers[index])
+                if len(indent_stack) > depth:
+                    line_stack.append(numbers[index])
                 index += 1
 
         return nodes
 
-    def _exec_nodes(self, nodes):
+    @classmethod
+    def _set_lines(cls, nodes, start, line):
+        for node in nodes[start:]:
+            node.line = line
+
+    def _budget(self):
+        if self.max_steps is None and self.max_items is None and \
+                self.timeout is None:
+            return None
+        return Budget(self.max_steps, self.max_items, self.timeout)
+
+    def _exec_nodes(self, nodes, budget=None):
         index = 0
 
-        items = []
+        trace = self.trace
+        items = TracedItemBuffer() if trace else ItemBuffer()
         scope = {}
         motion_stack = []
         macro_stack = []
@@ -88,6 +206,26 @@ class Compiler:
             'GAP': None,
         }
 
+        if budget is not None:
+            budget.start(items)
+
+        if self.profile:
+            profiler = Profiler(trace, budget)
+            self.profile_report = profiler.run(nodes, items, scope,
+                                               motion_stack, macro_stack,
+                                               options)
+            if budget is not None:
+                budget.check()
+            return items
+
+        if self.engine == 'closure' and not trace:
+            engine = ClosureEngine(items, scope, motion_stack, macro_stack,
+                                   options, budget)
+            engine.run(nodes)
+            if budget is not None:
+                budget.check()
+            return items
+
         while index < len(nodes):
             node = nodes[index]
 
@@ -96,18 +234,15 @@ class Compiler:
                 break
 
             # Execute the node
+            if budget is not None:
+                budget.spend()
+            if trace:
+                items.line = node.line
             jmp = node.exec(items, scope, motion_stack, macro_stack, options)
 
             # Change index
             index = jmp if jmp is not None else (index + 1)
 
+        if budget is not None:
+            budget.check()
         return items
-
-    def _sort_items(self, items):
-        items.sort(key=lambda item: (
-            isinstance(item, BoardItem),
-            isinstance(item, TextItem),
-            isinstance(item, WireItem),
-            isinstance(item, PinItem),
-            isinstance(item, PinqItem),
-        ), reverse=True)
@@ -0,0 +1,205 @@
+"""
+Daemon keeps pcbscript running in the background and executes command
+lines sent by clients over a Unix socket, so a call does not pay for
+starting Python and importing the drawing libraries, and the compilers
+and the caches of expressions stay warm between calls.
+
+A request is a JSON line with the arguments and the working directory of
+the client, the response is a JSON line with the output, the errors and
+the exit code of the command. Requests are executed one by one.
+
+The socket must be in a directory that belongs to the user and is closed
+to others (0700), and the socket itself must belong to the user, so no one
+else can pose as the daemon and read the command lines. The default
+directory pcbscript-<uid> is created so by the daemon. A client that does
+not trust the socket, or gets no answer to a ping in PING_TIMEOUT seconds,
+runs the command itself. Once the command is sent it is not run again: if
+the daemon does not answer it in REQUEST_TIMEOUT seconds or the connection
+breaks, the client fails with DaemonError, as the daemon may still be
+writing the outputs.
+"""
+
+import os
+import sys
+import json
+import stat
+import socket
+import tempfile
+import traceback
+import socketserver
+from io import StringIO
+from contextlib import redirect_stdout, redirect_stderr
+
+
+# Seconds to wait for the daemon to answer a ping and a command
+PING_TIMEOUT = 1.0
+REQUEST_TIMEOUT = 600.0
+
+
+class DaemonError(Exception):
+    pass
+
+
+def default_socket_path():
+    path = os.environ.get('PCBSCRIPT_SOCKET')
+    if path:
+        return path
+    base = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(base, f"pcbscript-{os.getuid()}", 'daemon.sock')
+
+
+def request(argv, path=None, timeout=REQUEST_TIMEOUT):
+    """
+    Sends the command line to the daemon and returns (stdout, stderr,
+    code), or None if the daemon is not running, is not trusted or does
+    not answer the ping. Raises DaemonError if the command was sent but
+    not answered.
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    path = path or default_socket_path()
+
+    if not os.path.lexists(path):
+        return None
+    if not is_trusted(path):
+        print(f"Daemon socket is not trusted, running locally: {path}",
+              file=sys.stderr)
+        return None
+
+    # The daemon is pinged first, so a busy or stuck one is not waited for
+    if argv and _send([], path, PING_TIMEOUT) is None:
+        return None
+    return _send(argv, path, timeout)
+
+
+def is_trusted(path):
+    """
+    Checks that the socket and its directory belong to the user and the
+    directory is closed to others.
+    """
+    try:
+        info = os.lstat(path)
+    except OSError:
+        return False
+    if not stat.S_ISSOCK(info.st_mode) or info.st_uid != os.getuid():
+        return False
+    return _is_private_dir(os.path.dirname(os.path.abspath(path)))
+
+
+def _is_private_dir(path):
+    try:
+        info = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISDIR(info.st_mode) and info.st_uid == os.getuid() and \
+        not info.st_mode & 0o077
+
+
+def _send(argv, path, timeout):
+    try:
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    except OSError:
+        return None
+
+    with client:
+        try:
+            client.settimeout(timeout)
+            client.connect(path)
+        except OSError:
+            return None
+
+        # From here on the daemon may be running the command
+        try:
+            message = {'argv': list(argv), 'cwd': os.getcwd()}
+            client.sendall(json.dumps(message).encode() + b'\n')
+            with client.makefile('rb') as f:
+                line = f.readline()
+            if not line:
+                raise ConnectionError("connection closed")
+            response = json.loads(line)
+            return response['stdout'], response['stderr'], response['code']
+        except (OSError, ValueError, KeyError) as exc:
+            if not argv:
+                return None
+            raise DaemonError(str(exc) or type(exc).__name__)
+
+
+class Daemon(socketserver.UnixStreamServer):
+    """
+    Server on a Unix socket that calls `execute(argv)` for every request.
+    """
+
+    def __init__(self, path, execute):
+        self.path = path
+        self.execute = execute
+
+        # The directory is private, the default one is created
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        if not _is_private_dir(directory):
+            raise OSError(f"socket directory must belong to the user and "
+                          f"be closed to others (0700): {directory}")
+
+        # Removing the socket of a daemon that is not running anymore
+        if os.path.lexists(path):
+            if _send([], path, PING_TIMEOUT) is not None:
+                raise OSError(f"daemon is already running: {path}")
+            os.remove(path)
+
+        super().__init__(path, _Handler)
+        os.chmod(path, 0o600)
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+
+        message = json.loads(line)
+        if message['argv']:
+            stdout, stderr, code = _run(self.server.execute,
+                                        message['argv'], message['cwd'])
+        else:
+            # Empty command line is a ping
+            stdout, stderr, code = '', '', 0
+
+        # A client that timed out is not waiting anymore
+        response = {'stdout': stdout, 'stderr': stderr, 'code': code}
+        try:
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+        except OSError:
+            pass
+
+
+def _run(execute, argv, cwd):
+    stdout = StringIO()
+    stderr = StringIO()
+    code = 0
+    current_dir = os.getcwd()
+
+    try:
+        os.chdir(cwd)
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                execute(argv)
+            except SystemExit as exc:
+                if exc.code is None or isinstance(exc.code, int):
+                    code = exc.code or 0
+                else:
+                    print(exc.code, file=sys.stderr)
+                    code = 1
+            except Exception:
+                traceback.print_exc()
+                code = 1
+    finally:
+        os.chdir(current_dir)
+
+    return stdout.getvalue(), stderr.getvalue(), code
@@ -1,6 +1,8 @@
 """
-Drawer takes items (the result of compilation) and
+Drawer takes items (ItemBuffer, the result of compilation) and
 transform it into an SVG picture that is stored to the given path.
+With merge_gaps the clearance shapes are drawn as a few compound paths
+(see clearance module) instead of an element per shape.
 """
 
 import math
@@ -11,11 +13,14 @@ import cairosvg
 from PIL import Image
 
 from .items import *
+from .clearance import clearance_paths, frame_path
 
 
 class Drawer:
-    def __init__(self, scale=100, color=(128, 196, 255), bg_color=(0, 16, 24)):
+    def __init__(self, scale=100, color=(128, 196, 255), bg_color=(0, 16, 24),
+                 merge_gaps=False):
         self._scale = scale
+        self._merge_gaps = merge_gaps
         self._color = svgwrite.rgb(*color)
         self._bg_color = svgwrite.rgb(*bg_color)
         self._gap = None
@@ -29,18 +34,18 @@ class Drawer:
 
         self._dwg = None
 
-        for item in items:
-            if isinstance(item, BoardItem):
-                self._define_dwg(item)
-                self._draw_board(item)
-            elif isinstance(item, PinItem):
-                self._draw_pin(item)
-            elif isinstance(item, PinqItem):
-                self._draw_pinq(item)
-            elif isinstance(item, TextItem):
-                self._draw_text(item)
-            elif isinstance(item, WireItem):
-                self._draw_wire(item)
+        for item in items.iter_boards():
+            self._define_dwg(item)
+            self._draw_board(item)
+        list(map(self._draw_text, items.iter_texts()))
+        list(map(self._draw_wire, items.iter_wires()))
+        list(map(self._draw_pin, items.iter_pins()))
+        list(map(self._draw_pinq, items.iter_pinqs()))
+
+        if self._gap and self._merge_gaps:
+            for d in clearance_paths(items, self._gap, self._scale):
+                path = self._dwg.path(d=d, fill=self._bg_color)
+                self._gap_items.append(path)
 
         list(map(self._dwg.add, self._gap_items))
         list(map(self._dwg.add, self._main_items))
@@ -98,7 +103,11 @@ class Drawer:
         self._gap_items.append(rect)
 
         # Drawing frame if gap
-        if self._gap:
+        if self._gap and self._merge_gaps:
+            item = self._dwg.path(d=frame_path(board, self._scale),
+                                  fill=self._bg_color)
+            self._gap_items.append(item)
+        elif self._gap:
             item = self._dwg.rect(
                 (0, 0),
                 (
@@ -140,7 +149,7 @@ class Drawer:
             self._gap_items.append(item)
 
     def _draw_pin(self, pin):
-        if self._gap:
+        if self._gap and not self._merge_gaps:
             gap_outer = self._dwg.circle(
                 (pin.x * self._scale, pin.y * self._scale),
                 (0.5 * pin.dout + self._gap) * self._scale,
@@ -163,7 +172,7 @@ class Drawer:
         self._main_items.append(inner)
 
     def _draw_pinq(self, pinq):
-        if self._gap:
+        if self._gap and not self._merge_gaps:
             outer = self._dwg.rect(
                 (
                     (pinq.x - 0.5 * pinq.dout - self._gap) * self._scale,
@@ -210,7 +219,7 @@ class Drawer:
         self._main_items.append(text)
 
     def _draw_wire(self, wire):
-        if self._gap:
+        if self._gap and not self._merge_gaps:
             items = self._draw_wire_step(wire, wire.width + 2 * self._gap,
                                          self._bg_color)
             self._gap_items.extend(items)
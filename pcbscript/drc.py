@@ -0,0 +1,103 @@
+"""
+Design rule check of compiled items. The rules are:
+    * short: copper shapes of different nets must not touch or overlap;
+    * clearance: copper shapes (pins, pinqs and wires) of different nets
+        must be at least `clearance` apart (the GAP option of the board
+        by default);
+    * wire_width: wires must be at least `min_width` wide;
+    * drill: holes of pins and pinqs must be at least `min_drill`
+        in diameter (a zero diameter means no hole);
+    * annular_ring: the copper ring around a hole must be at least
+        `min_ring` wide.
+
+The nets are joined by junctions only (a wire end or the center of a pad
+lies on the other shape, see nets module), so crossing wires or a wire
+grazing a pad are different nets and a short. Shapes of the same net can
+be as close as they are (like the two sides of a U-turn of a wire or a
+pad next to a bend of its own wire). Close shapes are found with the
+spatial hash of the geometry module, the nets are found from the same
+pairs.
+
+If the items are TracedItemBuffer, violations contain the source lines.
+"""
+
+from collections import namedtuple
+
+from .geometry import EPS, copper_shapes, near_pairs
+from .nets import nets_of
+
+
+Violation = namedtuple('violation', [
+    'rule', 'kind', 'line', 'x', 'y', 'value', 'limit',
+    'other_kind', 'other_line',
+])
+
+
+def check(items, clearance=None, min_width=0.1, min_drill=0.1,
+          min_ring=0.05):
+    """
+    Returns the list of violations sorted by the source line.
+    """
+    if clearance is None and items.boards:
+        clearance = items.boards[-1].gap
+    lines = getattr(items, 'lines', {})
+
+    def line_of(kind, index):
+        kind_lines = lines.get(kind)
+        if kind_lines:
+            return kind_lines[index] or None
+
+    violations = []
+
+    for index, (x1, y1, x2, y2, width) in enumerate(zip(*items.wires)):
+        if width < min_width:
+            violations.append(Violation(
+                'wire_width', 'wire', line_of('wire', index), x1, y1,
+                width, min_width, None, None,
+            ))
+
+    for kind, columns in (('pin', items.pins), ('pinq', items.pinqs)):
+        for index, (x, y, dout, din) in enumerate(zip(*columns)):
+            if not din:
+                continue
+            line = line_of(kind, index)
+            if din < min_drill:
+                violations.append(Violation(
+                    'drill', kind, line, x, y, din, min_drill, None, None,
+                ))
+            ring = 0.5 * (dout - din)
+            if ring < min_ring:
+                violations.append(Violation(
+                    'annular_ring', kind, line, x, y, ring, min_ring,
+                    None, None,
+                ))
+
+    # Touching pairs are among the near ones, so they give the nets,
+    # shorts are checked without a clearance too
+    copper = list(copper_shapes(items))
+    pairs = list(near_pairs(copper, clearance - EPS if clearance else EPS))
+    net_of = _net_numbers(nets_of(copper, pairs, junctions=True))
+    for number1, number2, x, y, distance in pairs:
+        kind1, index1, _ = copper[number1]
+        kind2, index2, _ = copper[number2]
+        if net_of[kind1, index1] == net_of[kind2, index2]:
+            continue
+        rule = 'short' if distance < EPS else 'clearance'
+        violations.append(Violation(
+            rule, kind1, line_of(kind1, index1), x, y, distance,
+            clearance, kind2, line_of(kind2, index2),
+        ))
+
+    violations.sort(key=lambda violation: violation.line or 0)
+    return violations
+
+
+def _net_numbers(nets):
+    # Numbers of the nets by (kind, index) of the shapes
+    numbers = {}
+    for number, net in enumerate(nets):
+        for pin in net.pins:
+            numbers[pin] = number
+        for index in net.wires:
+            numbers['wire', index] = number
+    return numbers
@@ -0,0 +1,259 @@
+"""
+Closure engine is an alternative to the interpreter loop of the compiler.
+It lowers the graph of nodes into a tree of Python closures and runs it,
+so loops become native Python loops and macro calls become direct calls.
+The structure of blocks is recovered from the jumps that commands leave
+in the graph:
+    * for: AssignNode, JmpNode(end, cond), body, AssignNode, JmpNode(back);
+    * if-else: JmpNode(else, not cond), body, JmpNode(end or None), else body;
+    * macro: JmpNode(end), body, MacroExitNode.
+The result is exactly the same as the interpreter produces.
+
+With a budget the closures spend the same steps as the interpreter: a run
+of plain nodes spends its length before it is executed, loops, if-blocks
+and calls spend the steps of their jumps.
+"""
+
+from .nodes import *
+from .batch import BatchForNode
+
+
+class EngineError(Exception):
+    pass
+
+
+class _Exit(Exception):
+    pass
+
+
+class ClosureEngine:
+    def __init__(self, items, scope, motion_stack, macro_stack, options,
+                 budget=None):
+        self._items = items
+        self._scope = scope
+        self._motion_stack = motion_stack
+        self._macro_stack = macro_stack
+        self._options = options
+        self._budget = budget
+        self._macros = {}
+
+    def run(self, nodes):
+        block = self._lower_block(nodes, 0, len(nodes))
+        try:
+            block()
+        except _Exit:
+            pass
+
+    def _lower_block(self, nodes, start, end):
+        steps = []
+        # Steps of plain nodes (and of the jumps over macros) to spend
+        costs = []
+        index = start
+
+        while index < end:
+            node = nodes[index]
+            cost = 0
+
+            if isinstance(node, JmpNode):
+                step, index = self._lower_jmp(nodes, index)
+                cost = 1 if step is None else 0
+            elif isinstance(node, BatchForNode):
+                step, index = self._lower_batch_for(nodes, index)
+            elif isinstance(node, MacroEnterNode):
+                step, index = self._lower_call(node), index + 1
+            elif isinstance(node, ExitNode):
+                step, index = self._lower_exit(), index + 1
+            else:
+                step = node.lower(self._items, self._scope,
+                                  self._motion_stack, self._macro_stack,
+                                  self._options)
+                cost = 1
+                index += 1
+
+            steps.append(step)
+            costs.append(cost)
+
+        if self._budget is not None:
+            steps = self._spending(steps, costs)
+        return self._sequence([step for step in steps if step is not None])
+
+    def _lower_jmp(self, nodes, index):
+        node = nodes[index]
+        end = node.jmp
+        last = nodes[end - 1] if end is not None and end > index else None
+
+        if node.expr is None and isinstance(last, MacroExitNode):
+            self._macros[index + 1] = self._lower_block(nodes, index + 1,
+                                                        end - 1)
+            return None, end
+
+        if node.expr is not None and isinstance(last, JmpNode):
+            if last.jmp == index:
+                return self._lower_for(nodes, index), end
+            if last.expr is None:
+                return self._lower_if(nodes, index), (last.jmp or end)
+
+        raise EngineError(f"unsupported jump at node {index}")
+
+    def _lower_for(self, nodes, index):
+        node = nodes[index]
+        body = self._lower_block(nodes, index + 1, node.jmp - 2)
+        increment = self._lower_block(nodes, node.jmp - 2, node.jmp - 1)
+        eval_stop = node.expr.eval
+        scope = self._scope
+
+        if self._budget is not None:
+            spend = self._budget.spend
+
+            # The check of the bound, then the back jump and the next check
+            def run():
+                spend(1)
+                while not eval_stop(scope):
+                    body()
+                    increment()
+                    spend(2)
+
+            return run
+
+        def run():
+            while not eval_stop(scope):
+                body()
+                increment()
+
+        return run
+
+    def _lower_batch_for(self, nodes, index):
+        # The loop is still lowered to be executed if the batch fails
+        node = nodes[index]
+        batch = node.lower(self._items, self._scope, self._motion_stack,
+                           self._macro_stack, self._options)
+        assign = node.assign.lower(self._items, self._scope,
+                                   self._motion_stack, self._macro_stack,
+                                   self._options)
+        loop, end = self._lower_jmp(nodes, index + 1)
+
+        if self._budget is not None:
+            spend = self._budget.spend
+
+            # The batch node or the assignment it replaces
+            def run():
+                spend(1)
+                if not batch():
+                    assign()
+                    loop()
+
+            return run, end
+
+        def run():
+            if not batch():
+                assign()
+                loop()
+
+        return run, end
+
+    def _lower_if(self, nodes, index):
+        node = nodes[index]
+        else_jmp = nodes[node.jmp - 1].jmp
+        body = self._lower_block(nodes, index + 1, node.jmp - 1)
+        else_body = None
+        if else_jmp is not None:
+            else_body = self._lower_block(nodes, node.jmp, else_jmp)
+        eval_skip = node.expr.eval
+        scope = self._scope
+
+        if self._budget is not None:
+            return self._lower_spending_if(body, else_body, eval_skip)
+
+        if else_jmp is None:
+            def run():
+                if not eval_skip(scope):
+                    body()
+        else:
+            def run():
+                if eval_skip(scope):
+                    else_body()
+                else:
+                    body()
+
+        return run
+
+    def _lower_spending_if(self, body, else_body, eval_skip):
+        # The condition, then the jump after the body if it runs
+        scope = self._scope
+        spend = self._budget.spend
+
+        def run():
+            spend(1)
+            if not eval_skip(scope):
+                body()
+                spend(1)
+            elif else_body is not None:
+                else_body()
+
+        return run
+
+    def _lower_call(self, node):
+        macros = self._macros
+        idx = node.jmp
+
+        if self._budget is not None:
+            spend = self._budget.spend
+
+            # MacroEnterNode and MacroExitNode
+            def run():
+                spend(1)
+                macros[idx]()
+                spend(1)
+
+            return run
+
+        def run():
+            macros[idx]()
+
+        return run
+
+    def _spending(self, steps, costs):
+        # Every run of plain nodes is preceded by spending its steps
+        result = []
+        run = []
+        run_cost = 0
+        for step, cost in zip(steps + [None], costs + [0]):
+            if cost:
+                run.append(step)
+                run_cost += cost
+                continue
+            if run_cost:
+                result.append(self._spend(run_cost))
+                result.extend(run)
+                run = []
+                run_cost = 0
+            result.append(step)
+        return result
+
+    def _spend(self, steps):
+        spend = self._budget.spend
+
+        def run():
+            spend(steps)
+
+        return run
+
+    @classmethod
+    def _lower_exit(cls):
+        def run():
+            raise _Exit()
+
+        return run
+
+    @classmethod
+    def _sequence(cls, steps):
+        steps = tuple(steps)
+
+        if len(steps) == 1:
+            return steps[0]
+
+        def run():
+            for step in steps:
+                step()
+
+        return run
@@ -0,0 +1,189 @@
+"""
+Geometry of copper shapes for checks and connectivity. Pins and wire
+segments are capsules (a segment grown by a radius, a pin is a segment
+of zero length), pinqs are boxes.
+
+To avoid comparing every pair of shapes, the shapes are put into a uniform
+grid (a spatial hash) with the cell about the size of a typical shape,
+and only the shapes sharing a cell are compared. Each pair is compared
+once: in the cell that contains the corner of the intersection of their
+boxes.
+"""
+
+import math
+
+
+# Distances below are considered touching
+EPS = 1e-9
+
+
+def copper_shapes(items):
+    # Shapes are ('capsule', ax, ay, bx, by, r) for pins and wires
+    # and ('box', x1, y1, x2, y2) for pinqs, along with their kinds
+    # and indices
+    for index, (x1, y1, x2, y2, width) in enumerate(zip(*items.wires)):
+        yield 'wire', index, ('capsule', x1, y1, x2, y2, 0.5 * width)
+
+    for index, (x, y, dout, din) in enumerate(zip(*items.pins)):
+        yield 'pin', index, ('capsule', x, y, x, y, 0.5 * dout)
+
+    for index, (x, y, dout, din) in enumerate(zip(*items.pinqs)):
+        h = 0.5 * dout
+        yield 'pinq', index, ('box', x - h, y - h, x + h, y + h)
+
+
+def _bbox(shape, margin):
+    if shape[0] == 'capsule':
+        _, ax, ay, bx, by, r = shape
+        r += margin
+        return min(ax, bx) - r, min(ay, by) - r, max(ax, bx) + r, \
+            max(ay, by) + r
+    else:
+        _, x1, y1, x2, y2 = shape
+        return x1 - margin, y1 - margin, x2 + margin, y2 + margin
+
+
+def near_pairs(shapes, limit):
+    """
+    Yields (number1, number2, x, y, distance) for the pairs of shapes
+    (numbers are positions in the list `shapes`) that are closer than
+    limit, x and y are the middle of the intersection of their boxes.
+    """
+    if not shapes:
+        return
+
+    # Boxes are grown by the half of limit, so near shapes overlap
+    bboxes = [_bbox(shape, 0.5 * limit) for _, _, shape in shapes]
+    sizes = sorted(max(x2 - x1, y2 - y1) for x1, y1, x2, y2 in bboxes)
+    cell = max(sizes[len(sizes) // 2], limit)
+
+    grid = {}
+    for number, (x1, y1, x2, y2) in enumerate(bboxes):
+        for i in range(math.floor(x1 / cell), math.floor(x2 / cell) + 1):
+            for j in range(math.floor(y1 / cell), math.floor(y2 / cell) + 1):
+                grid.setdefault((i, j), []).append(number)
+
+    for (i, j), numbers in grid.items():
+        for k, number1 in enumerate(numbers):
+            ax1, ay1, ax2, ay2 = bboxes[number1]
+            for number2 in numbers[k + 1:]:
+                bx1, by1, bx2, by2 = bboxes[number2]
+                x1, y1 = max(ax1, bx1), max(ay1, by1)
+                x2, y2 = min(ax2, bx2), min(ay2, by2)
+                if x1 > x2 or y1 > y2:
+                    continue
+                if math.floor(x1 / cell) != i or math.floor(y1 / cell) != j:
+                    continue
+
+                value = distance(shapes[number1][2], shapes[number2][2])
+                if value < limit:
+                    yield number1, number2, \
+                        0.5 * (x1 + x2), 0.5 * (y1 + y2), value
+
+
+def distance(shape1, shape2):
+    if shape1[0] == 'box' and shape2[0] == 'box':
+        _, ax1, ay1, ax2, ay2 = shape1
+        _, bx1, by1, bx2, by2 = shape2
+        return math.hypot(max(bx1 - ax2, ax1 - bx2, 0),
+                          max(by1 - ay2, ay1 - by2, 0))
+
+    if shape1[0] == 'box':
+        shape1, shape2 = shape2, shape1
+
+    _, ax, ay, bx, by, r = shape1
+    if shape2[0] == 'box':
+        return _segment_box(ax, ay, bx, by, *shape2[1:]) - r
+    else:
+        _, cx, cy, dx, dy, r2 = shape2
+        return _segment_segment(ax, ay, bx, by, cx, cy, dx, dy) - r - r2
+
+
+def is_junction(shape1, shape2):
+    """
+    True if the shapes are joined on purpose: an end of a wire or the
+    center of a pad of one shape lies on the other one. Shapes that only
+    touch (like crossing wires or a wire grazing a pad) are not.
+    """
+    for shape, other in ((shape1, shape2), (shape2, shape1)):
+        for x, y in _anchors(shape):
+            if _point_shape(x, y, other) <= EPS:
+                return True
+    return False
+
+
+def _anchors(shape):
+    if shape[0] == 'capsule':
+        _, ax, ay, bx, by, _ = shape
+        return (ax, ay), (bx, by)
+    else:
+        _, x1, y1, x2, y2 = shape
+        return (0.5 * (x1 + x2), 0.5 * (y1 + y2)),
+
+
+def _point_shape(px, py, shape):
+    if shape[0] == 'capsule':
+        _, ax, ay, bx, by, r = shape
+        return _point_segment(px, py, ax, ay, bx, by) - r
+    else:
+        return _point_box(px, py, *shape[1:])
+
+
+def _point_segment(px, py, ax, ay, bx, by):
+    dx, dy = bx - ax, by - ay
+    length2 = dx * dx + dy * dy
+    t = 0.0
+    if length2:
+        t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / length2))
+    return math.hypot(px - ax - t * dx, py - ay - t * dy)
+
+
+def _point_box(px, py, x1, y1, x2, y2):
+    return math.hypot(max(x1 - px, px - x2, 0), max(y1 - py, py - y2, 0))
+
+
+def _cross(ax, ay, bx, by, px, py):
+    return (bx - ax) * (py - ay) - (by - ay) * (px - ax)
+
+
+def _segment_segment(ax, ay, bx, by, cx, cy, dx, dy):
+    if _cross(cx, cy, dx, dy, ax, ay) * _cross(cx, cy, dx, dy, bx, by) < 0 \
+            and _cross(ax, ay, bx, by, cx, cy) * \
+            _cross(ax, ay, bx, by, dx, dy) < 0:
+        return 0.0
+    return min(
+        _point_segment(ax, ay, cx, cy, dx, dy),
+        _point_segment(bx, by, cx, cy, dx, dy),
+        _point_segment(cx, cy, ax, ay, bx, by),
+        _point_segment(dx, dy, ax, ay, bx, by),
+    )
+
+
+def _segment_box(ax, ay, bx, by, x1, y1, x2, y2):
+    # Liang-Barsky clipping tells if the segment crosses the box
+    t0, t1 = 0.0, 1.0
+    dx, dy = bx - ax, by - ay
+    for p, q in ((-dx, ax - x1), (dx, x2 - ax), (-dy, ay - y1),
+                 (dy, y2 - ay)):
+        if p == 0:
+            if q < 0:
+                break
+        else:
+            t = q / p
+            if p < 0:
+                t0 = max(t0, t)
+            else:
+                t1 = min(t1, t)
+    else:
+        if t0 <= t1:
+            return 0.0
+
+    # Otherwise the closest points are an end or a corner
+    return min(
+        _point_box(ax, ay, x1, y1, x2, y2),
+        _point_box(bx, by, x1, y1, x2, y2),
+        _point_segment(x1, y1, ax, ay, bx, by),
+        _point_segment(x2, y1, ax, ay, bx, by),
+        _point_segment(x2, y2, ax, ay, bx, by),
+        _point_segment(x1, y2, ax, ay, bx, by),
+    )
@@ -0,0 +1,175 @@
+"""
+GerberDrawer writes items (ItemBuffer) as a copper layer in Gerber
+RS-274X format. Like StreamDrawer, it writes the text right into a file
+as it goes through the items.
+
+Every unique pin diameter, pinq size and wire width gets one aperture
+(the holes of pins and pinqs are the holes of their apertures), pins and
+pinqs are flashed, wires are drawn. The aperture is selected only when it
+changes, and a coordinate is written only if it differs from the current
+point, so a polyline is written as a chain of draws.
+
+With the GAP option the board is a copper pour: the area inside the frame
+is a dark region, clearances of the items are cleared (clear polarity)
+and then the items are drawn over them. Texts are not exported.
+
+Board units are 0.1 inch, the Y axis goes up in Gerber.
+"""
+
+from io import StringIO
+
+
+# Board units in the 2.6 inch format
+_UNITS = 10 ** 5
+
+_HEADER = 'G04 pcbscript*\n' \
+          '%FSLAX26Y26*%\n' \
+          '%MOIN*%\n'
+_FOOTER = 'M02*\n'
+
+
+class GerberDrawer:
+    def __init__(self):
+        self._items = None
+        self._codes = None
+        self._height = 0
+        self._aperture = None
+        self._x = None
+        self._y = None
+
+    def draw(self, items):
+        self._items = items
+
+    def save(self, path):
+        if self._items is not None and self._items.boards:
+            with open(path, 'w', buffering=1 << 20) as f:
+                self.write(f)
+
+    def tostring(self):
+        buffer = StringIO()
+        self.write(buffer)
+        return buffer.getvalue()
+
+    def write(self, f):
+        items = self._items
+        if items is None or not items.boards:
+            raise ValueError("nothing to export: the script has no board")
+        board = items.boards[-1]
+        gap = board.gap
+
+        self._height = board.height
+        self._aperture = None
+        self._x = self._y = None
+
+        f.write(_HEADER)
+        self._write_apertures(f, items, gap)
+        f.write('G01*\n')
+
+        # Clearance layer
+        if gap:
+            self._write_pour(f, board)
+            f.write('%LPC*%\n')
+            self._write_wires(f, items, 2 * gap)
+            self._write_pads(f, 'C', items.pins, gap)
+            self._write_pads(f, 'R', items.pinqs, gap)
+            f.write('%LPD*%\n')
+
+        # Copper layer
+        self._write_wires(f, items, 0)
+        self._write_pads(f, 'C', items.pins, None)
+        self._write_pads(f, 'R', items.pinqs, None)
+
+        f.write(_FOOTER)
+
+    def _write_apertures(self, f, items, gap):
+        # Keys are (shape, size, hole) in board units, the same definitions
+        # share a code even if the sizes differ in the last bits
+        keys = set()
+        keys.update(('C', width, 0) for width in items.wires[4])
+        keys.update(('C', dout, din) for dout, din in zip(*items.pins[2:]))
+        keys.update(('R', dout, din) for dout, din in zip(*items.pinqs[2:]))
+        if gap:
+            keys.update(('C', width + 2 * gap, 0)
+                        for width in items.wires[4])
+            keys.update(('C', dout + 2 * gap, 0) for dout in items.pins[2])
+            keys.update(('R', dout + 2 * gap, 0) for dout in items.pinqs[2])
+
+        self._codes = {}
+        definitions = {}
+        for key in sorted(keys):
+            definition = self._define_aperture(*key)
+            code = definitions.get(definition)
+            if code is None:
+                code = definitions[definition] = len(definitions) + 10
+                f.write('%%ADD%d%s*%%\n' % (code, definition))
+            self._codes[key] = code
+
+    @classmethod
+    def _define_aperture(cls, shape, size, hole):
+        size *= 0.1
+        if shape == 'C':
+            definition = 'C,%.6f' % size
+        else:
+            definition = 'R,%.6fX%.6f' % (size, size)
+        if hole:
+            definition += 'X%.6f' % (hole * 0.1)
+        return definition
+
+    def _write_pour(self, f, board):
+        gap = board.gap
+        x1, y1 = gap, gap
+        x2, y2 = board.width - gap, board.height - gap
+        f.write('G36*\n')
+        f.write(self._point(x1, y1, 'D02'))
+        f.write(self._point(x2, y1, 'D01'))
+        f.write(self._point(x2, y2, 'D01'))
+        f.write(self._point(x1, y2, 'D01'))
+        f.write(self._point(x1, y1, 'D01'))
+        f.write('G37*\n')
+
+    def _write_wires(self, f, items, extra):
+        write = f.write
+        codes = self._codes
+
+        for x1, y1, x2, y2, width in zip(*items.wires):
+            self._select(f, codes['C', width + extra, 0])
+            if x1 == x2 and y1 == y2:
+                write(self._point(x1, y1, 'D03'))
+            else:
+                x, y = self._x, self._y
+                start = self._point(x1, y1, 'D02')
+                if self._x != x or self._y != y:
+                    write(start)
+                write(self._point(x2, y2, 'D01'))
+
+    def _write_pads(self, f, shape, columns, gap):
+        write = f.write
+        codes = self._codes
+
+        for x, y, dout, din in zip(*columns):
+            if gap is not None:
+                self._select(f, codes[shape, dout + 2 * gap, 0])
+            else:
+                self._select(f, codes[shape, dout, din])
+            write(self._point(x, y, 'D03'))
+
+    def _select(self, f, code):
+        if code != self._aperture:
+            f.write('D%d*\n' % code)
+            self._aperture = code
+
+    def _point(self, x, y, operation):
+        # Coordinates equal to the current point are omitted
+        x = round(x * _UNITS)
+        y = round((self._height - y) * _UNITS)
+        if x != self._x:
+            if y != self._y:
+                result = 'X%dY%d%s*\n' % (x, y, operation)
+            else:
+                result = 'X%d%s*\n' % (x, operation)
+        elif y != self._y:
+            result = 'Y%d%s*\n' % (y, operation)
+        else:
+            result = operation + '*\n'
+        self._x, self._y = x, y
+        return result
@@ -0,0 +1,320 @@
+"""
+Inlining of macros. Every call of a macro is replaced with the commands of
+its body shifted to the indent of the call, so the graph has no jumps
+through MacroEnterNode and MacroExitNode and no return stack, and the
+passes after it see the body as ordinary code.
+
+Arguments are local to an inlined body: the names of the arguments are
+replaced with the literals the call passes (constant arguments) or with
+fresh variables assigned once before the body. A macro is inlined only if
+that gives exactly the same result as the interpreter, where the
+arguments are global variables that stay set after the call, so it is
+not inlined if:
+    * the names of its arguments are used anywhere else in the inlined
+        script (the leftover globals could be seen there);
+    * it calls itself, or some call passes another number of arguments;
+    * an expression of its body binds an argument name (lambda,
+        comprehension, :=);
+    * it is never called.
+The definitions of inlined macros are dropped. Nodes made from an inlined
+body keep the source lines of the body.
+"""
+
+import ast
+from bisect import bisect_left
+from functools import lru_cache
+
+from .commands import *
+
+
+def inline_macros(commands, numbers):
+    """
+    Returns (commands, numbers) with the calls of macros inlined.
+    """
+    if not any(isinstance(command, MarcoDefCommand) for command in commands):
+        return commands, numbers
+    if any(isinstance(command, MarcoDefCommand) and command.indent > 0
+           for command in commands):
+        return commands, numbers
+
+    inliner = _Inliner(commands, numbers)
+    return inliner.run()
+
+
+class _Macro:
+    def __init__(self, index, command):
+        self.index = index
+        self.name = command.args[0].value
+        self.args = [arg.value for arg in command.args[1:]]
+        self.body = []
+        self.calls = 0
+
+
+class _Inliner:
+    def __init__(self, commands, numbers):
+        self._program = list(zip(commands, numbers, range(len(commands))))
+        self._macros = {}
+        self._defs = {}
+
+        # Macros and their bodies
+        macro = None
+        for entry in self._program:
+            command, _, index = entry
+            if isinstance(command, MarcoDefCommand):
+                macro = self._macros[index] = _Macro(index, command)
+                self._defs.setdefault(macro.name, []).append(index)
+            elif command.indent == 0:
+                macro = None
+            elif macro is not None:
+                macro.body.append(entry)
+
+        self._used = set()
+        for command, _, _ in self._program:
+            self._used.update(_command_names(command))
+        self._fresh = 0
+
+    def run(self):
+        inlined = {index for index, macro in self._macros.items()
+                   if self._can_inline(macro)}
+
+        # Excluding the macros whose arguments are used out of their
+        # bodies until nothing changes
+        while True:
+            self._inlined = inlined
+            program = self._expand(self._program)
+            names = set()
+            for command, _ in program:
+                names.update(_command_names(command))
+            excluded = {index for index in inlined
+                        if names.intersection(self._macros[index].args)}
+            if not excluded:
+                break
+            inlined = inlined - excluded
+
+        commands = [command for command, _ in program]
+        numbers = [number for _, number in program]
+        return commands, numbers
+
+    def _resolve(self, name, index):
+        # Macro defined last before the call
+        indices = self._defs.get(name)
+        if not indices:
+            return None
+        position = bisect_left(indices, index)
+        if position == 0:
+            return None
+        return self._macros[indices[position - 1]]
+
+    def _can_inline(self, macro):
+        for command, _, index in self._program:
+            if not isinstance(command, MarcoCallCommand):
+                continue
+            if self._resolve(command.args[0].value, index) is not macro:
+                continue
+            if len(command.args) - 1 != len(macro.args):
+                return False
+            macro.calls += 1
+
+        if not macro.calls:
+            return False
+
+        for command, _, _ in macro.body:
+            if _command_bound_names(command).intersection(macro.args):
+                return False
+
+        # Calls of the body assign the arguments of the called macros,
+        # they must not be the arguments of this one
+        callees = self._callees(macro)
+        if callees is None or macro in callees:
+            return False
+        for callee in callees:
+            if set(callee.args).intersection(macro.args):
+                return False
+
+        return True
+
+    def _callees(self, macro):
+        # Macros called by the body directly or indirectly, None if some
+        # call is unknown
+        callees = set()
+        for command, _, index in macro.body:
+            if isinstance(command, MarcoCallCommand):
+                callee = self._resolve(command.args[0].value, index)
+                if callee is None:
+                    return None
+                if callee is not macro and callee not in callees:
+                    nested = self._callees(callee)
+                    if nested is None:
+                        return None
+                    callees.update(nested)
+                callees.add(callee)
+        return callees
+
+    def _expand(self, entries):
+        # Entries are (command, number, index), the result is a list of
+        # (command, number)
+        result = []
+        skip = False
+        for command, number, index in entries:
+            if isinstance(command, MarcoDefCommand):
+                skip = index in self._inlined
+            elif command.indent == 0:
+                skip = False
+            if skip:
+                continue
+
+            macro = None
+            if isinstance(command, MarcoCallCommand):
+                macro = self._resolve(command.args[0].value, index)
+            if macro is not None and macro.index in self._inlined:
+                result.extend(self._inline_call(command, number, macro))
+            else:
+                result.append((command, number))
+
+        return result
+
+    def _inline_call(self, call, number, macro):
+        body = self._expand(macro.body)
+        assigned = set()
+        for command, _ in body:
+            assigned.update(_command_targets(command))
+            assigned.update(_command_bound_names(command))
+
+        # Literals go right into the expressions, other values are
+        # assigned to fresh variables
+        result = []
+        mapping = {}
+        for arg, value in zip(macro.args, call.args[1:]):
+            # The arguments are assigned one by one, so a value can refer
+            # to the arguments before it
+            value = _rename_expr(value.value, mapping)
+            literal = _literal(value)
+            if literal is not None and arg not in assigned:
+                mapping[arg] = literal
+            else:
+                name = self._fresh_name(arg)
+                mapping[arg] = ast.Name(name, ast.Load())
+                var = VarCommand([String(name), Number(value)], call.indent)
+                result.append((var, number))
+
+        shift = call.indent - 1
+        for command, line in body:
+            result.append((_rename(command, mapping, shift), line))
+
+        return result
+
+    def _fresh_name(self, arg):
+        while True:
+            self._fresh += 1
+            name = f"{arg}__{self._fresh}"
+            if name not in self._used:
+                self._used.add(name)
+                return name
+
+
+def _literal(expr):
+    # AST of a number literal (possibly signed) or None
+    node = ast.parse(expr.strip(), mode='eval').body
+    value = node.operand if isinstance(node, ast.UnaryOp) and \
+        isinstance(node.op, (ast.UAdd, ast.USub)) else node
+    if isinstance(value, ast.Constant) and type(value.value) in (int, float):
+        return node
+    return None
+
+
+def _expressions(command):
+    for arg in command.args:
+        if isinstance(arg, Number):
+            yield arg.value
+        elif isinstance(arg, Coord):
+            yield arg.x
+            yield arg.y
+
+
+def _command_targets(command):
+    # Variables assigned by the command
+    if isinstance(command, (VarCommand, ForCommand)):
+        return {command.args[0].value}
+    if isinstance(command, MarcoDefCommand):
+        return {arg.value for arg in command.args[1:]}
+    return set()
+
+
+def _command_names(command):
+    names = _command_targets(command)
+    for expr in _expressions(command):
+        names.update(_expr_names(expr))
+    return names
+
+
+def _command_bound_names(command):
+    names = set()
+    for expr in _expressions(command):
+        names.update(_expr_bound_names(expr))
+    return names
+
+
+@lru_cache(maxsize=65536)
+def _expr_names(expr):
+    tree = ast.parse(expr.strip(), mode='eval')
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            names.add(node.id)
+        elif isinstance(node, ast.arg):
+            names.add(node.arg)
+    return frozenset(names)
+
+
+@lru_cache(maxsize=65536)
+def _expr_bound_names(expr):
+    tree = ast.parse(expr.strip(), mode='eval')
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+            names.add(node.id)
+        elif isinstance(node, ast.arg):
+            names.add(node.arg)
+    return frozenset(names)
+
+
+def _rename(command, mapping, shift):
+    if not mapping or not _command_names(command).intersection(mapping):
+        if not shift:
+            return command
+        return command.__class__(command.args, command.indent + shift)
+
+    args = []
+    for position, arg in enumerate(command.args):
+        if isinstance(arg, Number):
+            arg = Number(_rename_expr(arg.value, mapping))
+        elif isinstance(arg, Coord):
+            arg = Coord(_rename_expr(arg.x, mapping),
+                        _rename_expr(arg.y, mapping))
+        elif position == 0 and arg.value in mapping and \
+                arg.value in _command_targets(command):
+            arg = String(mapping[arg.value].id)
+        args.append(arg)
+
+    return command.__class__(args, command.indent + shift)
+
+
+def _rename_expr(expr, mapping):
+    if not _expr_names(expr).intersection(mapping):
+        return expr
+    tree = ast.parse(expr.strip(), mode='eval')
+    tree = _Renamer(mapping).visit(tree)
+    return ast.unparse(tree)
+
+
+class _Renamer(ast.NodeTransformer):
+    def __init__(self, mapping):
+        self._mapping = mapping
+
+    def visit_Name(self, node):
+        new = self._mapping.get(node.id)
+        if new is None:
+            return node
+        if isinstance(new, ast.Name):
+            return ast.Name(new.id, node.ctx)
+        return new
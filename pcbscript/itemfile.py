@@ -0,0 +1,187 @@
+"""
+Binary file of compiled items, so a script can be compiled once and drawn
+or exported many times (each time in its own process if needed).
+
+The file is little-endian and consists of:
+    * the header: magic b'PCBI', version, flags, the numbers of boards,
+        texts, wires, pins and pinqs and the size of the string table;
+    * boards as records of 3 doubles (width, height, gap, NaN means
+        no gap);
+    * columns of doubles of texts (x, y, height), then offsets of the
+        texts in the string table (numbers of texts + 1 integers);
+    * columns of doubles of wires, pins and pinqs in the order of fields
+        of their items;
+    * if the flag LINES is set (TracedItemBuffer), columns of 64-bit
+        integers of source lines of boards, texts, wires, pins and pinqs;
+    * the string table: UTF-8 texts one after another.
+
+All the sections are multiples of 8 bytes, so the columns are aligned.
+load_items memory-maps the file and returns ItemBuffer whose columns are
+memoryviews over the mapping, so nothing is copied or parsed until it is
+used (texts are decoded on access). Such items are read-only.
+The items are TracedItemBuffer if the file has lines.
+"""
+
+import os
+import sys
+import math
+import mmap
+import struct
+from array import array
+
+from .items import *
+
+
+MAGIC = b'PCBI'
+VERSION = 1
+EXTENSION = '.pcbi'
+
+# Flags
+LINES = 0x0001
+
+_HEADER = struct.Struct('<4sHH6Q')
+_LITTLE = sys.byteorder == 'little'
+
+
+class ItemFileError(Exception):
+    pass
+
+
+def save_items(items, path):
+    with open(path, 'wb') as f:
+        write_items(items, f)
+
+
+def write_items(items, f):
+    strings = [text.encode() for text in items.texts[0]]
+    offsets = array('Q', [0])
+    for string in strings:
+        offsets.append(offsets[-1] + len(string))
+
+    lines = getattr(items, 'lines', None)
+    f.write(_HEADER.pack(
+        MAGIC, VERSION, LINES if lines else 0, len(items.boards),
+        len(strings), len(items.wires[0]), len(items.pins[0]),
+        len(items.pinqs[0]), offsets[-1],
+    ))
+
+    boards = array('d')
+    for board in items.boards:
+        gap = math.nan if board.gap is None else board.gap
+        boards.extend((board.width, board.height, gap))
+    _write_array(f, boards)
+
+    for column in items.texts[1:]:
+        _write_array(f, array('d', column))
+    _write_array(f, offsets)
+
+    for columns in (items.wires, items.pins, items.pinqs):
+        for column in columns:
+            _write_array(f, array('d', column))
+
+    if lines:
+        for kind in KINDS:
+            _write_array(f, array('q', lines[kind]))
+
+    f.writelines(strings)
+
+
+def load_items(path):
+    """
+    Memory-maps the file and returns read-only ItemBuffer over it.
+    """
+    with open(path, 'rb') as f:
+        # An empty file cannot be mapped
+        if os.fstat(f.fileno()).st_size < _HEADER.size:
+            raise ItemFileError("file is too short")
+        data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    magic, version, flags, boards_count, texts_count, wires_count, \
+        pins_count, pinqs_count, strings_size = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ItemFileError("not a file of compiled items")
+    if version != VERSION:
+        raise ItemFileError(f"unsupported version: {version}")
+
+    counts = {
+        'board': boards_count,
+        'text': texts_count,
+        'wire': wires_count,
+        'pin': pins_count,
+        'pinq': pinqs_count,
+    }
+    size = _HEADER.size + 8 * (
+        3 * boards_count + 4 * texts_count + 1 + 5 * wires_count +
+        4 * pins_count + 4 * pinqs_count
+    ) + strings_size
+    if flags & LINES:
+        size += 8 * sum(counts.values())
+    if len(data) != size:
+        raise ItemFileError("file size does not match the header")
+
+    offset = _HEADER.size
+
+    def take(typecode, count):
+        nonlocal offset
+        column = _view(data[offset:offset + 8 * count], typecode)
+        offset += 8 * count
+        return column
+
+    items = TracedItemBuffer() if flags & LINES else ItemBuffer()
+
+    boards = take('d', 3 * boards_count)
+    for index in range(0, len(boards), 3):
+        width, height, gap = boards[index:index + 3]
+        items.boards.append(
+            BoardItem(width, height, None if math.isnan(gap) else gap)
+        )
+
+    xs, ys, heights = (take('d', texts_count) for _ in range(3))
+    offsets = take('Q', texts_count + 1)
+    items.wires = tuple(take('d', wires_count) for _ in WireItem._fields)
+    items.pins = tuple(take('d', pins_count) for _ in PinItem._fields)
+    items.pinqs = tuple(take('d', pinqs_count) for _ in PinqItem._fields)
+    if flags & LINES:
+        items.lines = {kind: take('q', counts[kind]) for kind in KINDS}
+    items.texts = (_Strings(data[offset:], offsets), xs, ys, heights)
+
+    return items
+
+
+def _write_array(f, values):
+    if not _LITTLE:
+        values = array(values.typecode, values)
+        values.byteswap()
+    f.write(values.tobytes())
+
+
+def _view(data, typecode):
+    if _LITTLE:
+        return data.cast(typecode)
+    values = array(typecode)
+    values.frombytes(data)
+    values.byteswap()
+    return values
+
+
+class _Strings:
+    """
+    Sequence of the texts of the string table decoded on access.
+    """
+
+    def __init__(self, data, offsets):
+        self._data = data
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        if not -len(self) <= index < len(self):
+            raise IndexError("text index out of range")
+        index %= len(self)
+        start, end = self._offsets[index], self._offsets[index + 1]
+        return str(self._data[start:end], 'utf-8')
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self)))
@@ -1,8 +1,15 @@
 """
 There are basic result items that define the board.
 Each item has full information about how it must be drawn.
+
+Compiled items are stored in ItemBuffer that keeps each kind of items in
+its own typed array columns, so a large board does not hold a Python object
+per item. The kinds are kept apart in the order they must be drawn
+(board, text, wire, pin, pinq), so the items never need to be sorted.
+TracedItemBuffer also keeps the source line of every item.
 """
 
+from array import array
 from collections import namedtuple
 
 
@@ -12,6 +19,130 @@ PinqItem = namedtuple('pinq', ['x', 'y', 'dout', 'din'])
 WireItem = namedtuple('wire', ['x1', 'y1', 'x2', 'y2', 'width'])
 TextItem = namedtuple('text', ['text', 'x', 'y', 'height'])
 
+# Type names are used in serialization, qualified names make items picklable
+BoardItem.__qualname__ = 'BoardItem'
+PinItem.__qualname__ = 'PinItem'
+PinqItem.__qualname__ = 'PinqItem'
+WireItem.__qualname__ = 'WireItem'
+TextItem.__qualname__ = 'TextItem'
+
+# Kinds of items in the order they are drawn
+KINDS = ['board', 'text', 'wire', 'pin', 'pinq']
+
+
+class ItemBuffer:
+    def __init__(self):
+        self.boards = []
+        self.texts = ([], array('d'), array('d'), array('d'))
+        self.wires = tuple(array('d') for _ in WireItem._fields)
+        self.pins = tuple(array('d') for _ in PinItem._fields)
+        self.pinqs = tuple(array('d') for _ in PinqItem._fields)
+
+    def __len__(self):
+        return len(self.boards) + len(self.texts[0]) + \
+            len(self.wires[0]) + len(self.pins[0]) + len(self.pinqs[0])
+
+    def __iter__(self):
+        yield from self.iter_boards()
+        yield from self.iter_texts()
+        yield from self.iter_wires()
+        yield from self.iter_pins()
+        yield from self.iter_pinqs()
+
+    def append(self, item):
+        if isinstance(item, BoardItem):
+            self.add_board(*item)
+        elif isinstance(item, TextItem):
+            self.add_text(*item)
+        elif isinstance(item, WireItem):
+            self.add_wire(*item)
+        elif isinstance(item, PinItem):
+            self.add_pin(*item)
+        elif isinstance(item, PinqItem):
+            self.add_pinq(*item)
+        else:
+            raise TypeError(f"unknown item: {item}")
+
+    def add_board(self, width, height, gap):
+        self.boards.append(BoardItem(width, height, gap))
+
+    def add_text(self, text, x, y, height):
+        texts, xs, ys, heights = self.texts
+        texts.append(text)
+        xs.append(x)
+        ys.append(y)
+        heights.append(height)
+
+    def add_wire(self, x1, y1, x2, y2, width):
+        x1s, y1s, x2s, y2s, widths = self.wires
+        x1s.append(x1)
+        y1s.append(y1)
+        x2s.append(x2)
+        y2s.append(y2)
+        widths.append(width)
+
+    def add_pin(self, x, y, dout, din):
+        xs, ys, douts, dins = self.pins
+        xs.append(x)
+        ys.append(y)
+        douts.append(dout)
+        dins.append(din)
+
+    def add_pinq(self, x, y, dout, din):
+        xs, ys, douts, dins = self.pinqs
+        xs.append(x)
+        ys.append(y)
+        douts.append(dout)
+        dins.append(din)
+
+    def iter_boards(self):
+        return iter(self.boards)
+
+    def iter_texts(self):
+        return map(TextItem._make, zip(*self.texts))
+
+    def iter_wires(self):
+        return map(WireItem._make, zip(*self.wires))
+
+    def iter_pins(self):
+        return map(PinItem._make, zip(*self.pins))
+
+    def iter_pinqs(self):
+        return map(PinqItem._make, zip(*self.pinqs))
+
+
+class TracedItemBuffer(ItemBuffer):
+    """
+    ItemBuffer that remembers the source line of every item: it is the value
+    of `line` at the moment the item is added (the executor sets it to
+    the line of the current node). Lines are kept by kind in `lines`.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.line = None
+        self.lines = {kind: array('l') for kind in KINDS}
+
+    def add_board(self, width, height, gap):
+        self.lines['board'].append(self.line or 0)
+        super().add_board(width, height, gap)
+
+    def add_text(self, text, x, y, height):
+        self.lines['text'].append(self.line or 0)
+        super().add_text(text, x, y, height)
+
+    def add_wire(self, x1, y1, x2, y2, width):
+        self.lines['wire'].append(self.line or 0)
+        super().add_wire(x1, y1, x2, y2, width)
+
+    def add_pin(self, x, y, dout, din):
+        self.lines['pin'].append(self.line or 0)
+        super().add_pin(x, y, dout, din)
+
+    def add_pinq(self, x, y, dout, din):
+        self.lines['pinq'].append(self.line or 0)
+        super().add_pinq(x, y, dout, din)
+
 
 def serialize(item):
     args = ' '.join(map(_serialize_value, item))
@@ -19,7 +150,11 @@ def serialize(item):
 
 
 def _serialize_value(value):
+    # Columns store every number as a float, integral ones are written as
+    # integers like before
     if isinstance(value, str):
         return f'"{value}"'
+    elif isinstance(value, float) and value.is_integer():
+        return str(int(value))
     else:
         return str(value)
@@ -1,24 +1,78 @@
+"""
+Motions are 2D affine transformations of coordinates:
+    x' = a * x + b * y + e
+    y' = c * x + d * y + f
+Translation, rotation and scale (including mirror as a scale by -1) are
+all represented this way, so nested motions can be composed into one
+motion when they are pushed into the motion stack, and any coordinate
+is transformed with a single multiply-add whatever the nesting depth is.
+"""
+
 import math
+from functools import lru_cache
 
 
 class BaseMotion:
+    def __init__(self, a=1.0, b=0.0, c=0.0, d=1.0, e=0.0, f=0.0):
+        self._a = a
+        self._b = b
+        self._c = c
+        self._d = d
+        self._e = e
+        self._f = f
+
     def transform(self, x, y):
-        raise NotImplementedError()
+        return (self._a * x + self._b * y + self._e,
+                self._c * x + self._d * y + self._f)
+
+    def compose(self, other):
+        # Motion that applies other first and then self
+        a, b, c, d = self._a, self._b, self._c, self._d
+        return BaseMotion(
+            a * other._a + b * other._c,
+            a * other._b + b * other._d,
+            c * other._a + d * other._c,
+            c * other._b + d * other._d,
+            a * other._e + b * other._f + self._e,
+            c * other._e + d * other._f + self._f,
+        )
 
 
 class Translation(BaseMotion):
     def __init__(self, x, y):
-        self._x = x
-        self._y = y
+        super().__init__(e=x, f=y)
 
     def transform(self, x, y):
-        return x + self._x, y + self._y
+        return x + self._e, y + self._f
 
 
 class Rotation(BaseMotion):
     def __init__(self, phi):
-        self._cos = math.cos(phi * math.pi / 180)
-        self._sin = math.sin(phi * math.pi / 180)
+        cos, sin = _cos_sin(phi)
+        super().__init__(cos, sin, -sin, cos)
 
-    def transform(self, x, y):
-        return (x * self._cos + y * self._sin, -x * self._sin + y * self._cos)
+
+class Scale(BaseMotion):
+    def __init__(self, kx, ky):
+        super().__init__(a=kx, d=ky)
+
+
+class Mirror(Scale):
+    def __init__(self, axis):
+        if axis == 'x':
+            super().__init__(1.0, -1.0)
+        elif axis == 'y':
+            super().__init__(-1.0, 1.0)
+        else:
+            raise ValueError(f"invalid mirror axis: {axis}")
+
+
+def push_motion(motion_stack, motion):
+    if motion_stack:
+        motion = motion_stack[-1].compose(motion)
+    motion_stack.append(motion)
+
+
+@lru_cache(maxsize=1024)
+def _cos_sin(phi):
+    return math.cos(phi * math.pi / 180), math.sin(phi * math.pi / 180)
@@ -0,0 +1,70 @@
+"""
+Connectivity of the board. Pins, pinqs and wire segments that touch or
+overlap each other are joined into electrical nets: touching pairs are
+found with the spatial hash of the geometry module and merged with
+union-find.
+
+With junctions only shapes joined on purpose are merged: a wire end or
+the center of a pad lies on the other shape (see geometry.is_junction).
+These are the nets the shapes are meant to have, the design rule check
+reports the other touching pairs as shorts.
+"""
+
+from collections import namedtuple
+
+from .geometry import EPS, copper_shapes, is_junction, near_pairs
+
+
+# Pins are pairs (kind, index), kind is 'pin' or 'pinq',
+# wires are indices of the wire segments
+Net = namedtuple('net', ['pins', 'wires'])
+
+
+def find_nets(items, junctions=False):
+    """
+    Returns the list of nets. The nets with pins go first in the order of
+    their first pins, then the nets of wires only.
+    """
+    shapes = list(copper_shapes(items))
+    return nets_of(shapes, near_pairs(shapes, EPS), junctions)
+
+
+def nets_of(shapes, pairs, junctions=False):
+    """
+    Returns the nets of the shapes (as copper_shapes yields them) joined
+    by the pairs that touch among `pairs` (as near_pairs yields them, so
+    the pairs found for a bigger limit can be reused), or only by the
+    junctions among them.
+    """
+    parent = list(range(len(shapes)))
+
+    def find(number):
+        while parent[number] != number:
+            parent[number] = parent[parent[number]]
+            number = parent[number]
+        return number
+
+    for number1, number2, _, _, distance in pairs:
+        if distance >= EPS or junctions and \
+                not is_junction(shapes[number1][2], shapes[number2][2]):
+            continue
+        parent[find(number1)] = find(number2)
+
+    nets = {}
+    for number, (kind, index, _) in enumerate(shapes):
+        if kind != 'wire':
+            net = nets.setdefault(find(number), Net([], []))
+            net.pins.append((kind, index))
+    for number, (kind, index, _) in enumerate(shapes):
+        if kind == 'wire':
+            net = nets.setdefault(find(number), Net([], []))
+            net.wires.append(index)
+
+    return list(nets.values())
+
+
+def is_unconnected(net):
+    """
+    True if the net is a single pin that connects to nothing.
+    """
+    return len(net.pins) == 1 and not net.wires
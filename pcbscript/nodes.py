@@ -3,7 +3,8 @@ There are nodes and their behaviour. Each node can:
     * add new items to the result;
     * change the scope of variables;
     * change motion_stack that is needed to translate or rotate coordinates
-        inside translate and rotate blocks;
+        inside translate and rotate blocks (each level of the stack keeps
+        the motion composed with all the outer ones);
     * add to macro_stack where macroses (like functions) are stored;
     * fill and change options (that contain some default values);
     * stop the script;
@@ -12,7 +13,7 @@ There are nodes and their behaviour. Each node can:
 
 from .items import *
 from .motions import *
-from .values import Number
+from .values import Number, ExpressionError, MAX_INT_BITS
 
 
 class NodeError(Exception):
@@ -20,17 +21,29 @@ class NodeError(Exception):
 
 
 class BaseNode:
+    # Source line of the command the node comes from
+    line = None
+
     def __repr__(self):
         return self.__class__.__name__
 
     def exec(self, items, scope, motion_stack, macro_stack, options):
         raise NotImplementedError()
 
+    def lower(self, items, scope, motion_stack, macro_stack, options):
+        # Closure that executes the node with the bound state
+        exec_ = self.exec
+
+        def run():
+            exec_(items, scope, motion_stack, macro_stack, options)
+
+        return run
+
     @classmethod
     def _eval_coord(cls, coord, scope, motion_stack):
         x, y = coord.eval(scope)
-        for motion in reversed(motion_stack):
-            x, y = motion.transform(x, y)
+        if motion_stack:
+            x, y = motion_stack[-1].transform(x, y)
         return x, y
 
     @classmethod
@@ -61,8 +74,7 @@ class BoardNode(BaseNode):
 
     def exec(self, items, scope, motion_stack, macro_stack, options):
         width, heigth = self.coord.eval(scope)
-        item = BoardItem(width, heigth, options['GAP'])
-        items.append(item)
+        items.add_board(width, heigth, options['GAP'])
 
 
 class PinNode(BaseNode):
@@ -75,8 +87,7 @@ class PinNode(BaseNode):
         x, y = self._eval_coord(self.coord, scope, motion_stack)
         dout = self._get_value_or_option(self.dout, 'PIN_DOUT', scope, options)
         din = self._get_value_or_option(self.din, 'PIN_DIN', scope, options)
-        item = PinItem(x, y, dout, din)
-        items.append(item)
+        items.add_pin(x, y, dout, din)
 
 
 class PinqNode(BaseNode):
@@ -89,8 +100,7 @@ class PinqNode(BaseNode):
         x, y = self._eval_coord(self.coord, scope, motion_stack)
         dout = self._get_value_or_option(self.dout, 'PIN_DOUT', scope, options)
         din = self._get_value_or_option(self.din, 'PIN_DIN', scope, options)
-        item = PinqItem(x, y, dout, din)
-        items.append(item)
+        items.add_pinq(x, y, dout, din)
 
 
 class WireNode(BaseNode):
@@ -104,8 +114,7 @@ class WireNode(BaseNode):
         for coord1, coord2 in zip(self.coords[:-1], self.coords[1:]):
             x1, y1 = self._eval_coord(coord1, scope, motion_stack)
             x2, y2 = self._eval_coord(coord2, scope, motion_stack)
-            item = WireItem(x1, y1, x2, y2, width)
-            items.append(item)
+            items.add_wire(x1, y1, x2, y2, width)
 
 
 class TextNode(BaseNode):
@@ -118,8 +127,7 @@ class TextNode(BaseNode):
         x, y = self._eval_coord(self.coord, scope, motion_stack)
         height = self._get_value_or_option(self.height, 'TEXT_HEIGHT',
                                            scope, options)
-        item = TextItem(self.text.value, x, y, height)
-        items.append(item)
+        items.add_text(self.text.value, x, y, height)
 
 
 class AssignNode(BaseNode):
@@ -128,7 +136,23 @@ class AssignNode(BaseNode):
         self.expr = expr
 
     def exec(self, items, scope, motion_stack, macro_stack, options):
-        scope[self.var_name] = self.expr.eval(scope)
+        # Integers growing in a loop (x = x * x) would take all the memory
+        value = self.expr.eval(scope)
+        if type(value) is int and value.bit_length() > MAX_INT_BITS:
+            raise ExpressionError(f"integer is too big: {self.var_name}")
+        scope[self.var_name] = value
+
+    def lower(self, items, scope, motion_stack, macro_stack, options):
+        var_name = self.var_name
+        eval_expr = self.expr.eval
+
+        def run():
+            value = eval_expr(scope)
+            if type(value) is int and value.bit_length() > MAX_INT_BITS:
+                raise ExpressionError(f"integer is too big: {var_name}")
+            scope[var_name] = value
+
+        return run
 
 
 class JmpNode(BaseNode):
@@ -148,7 +172,7 @@ class TranslateEnterNode(BaseNode):
     def exec(self, items, scope, motion_stack, macro_stack, options):
         x, y = self.coord.eval(scope)
         motion = Translation(x, y)
-        motion_stack.append(motion)
+        push_motion(motion_stack, motion)
 
 
 class TranslateExitNode(BaseNode):
@@ -163,7 +187,7 @@ class RotateEnterNode(BaseNode):
     def exec(self, items, scope, motion_stack, macro_stack, options):
         phi = self.coord.eval(scope)
         motion = Rotation(phi)
-        motion_stack.append(motion)
+        push_motion(motion_stack, motion)
 
 
 class RotateExitNode(BaseNode):
@@ -172,9 +196,10 @@ class RotateExitNode(BaseNode):
 
 
 class MacroEnterNode(BaseNode):
-    def __init__(self, jmp, idx):
+    def __init__(self, jmp, idx, name=None):
         self.jmp = jmp
         self.idx = idx
+        self.name = name
 
     def exec(self, items, scope, motion_stack, macro_stack, options):
         macro_stack.append(self.idx)
@@ -0,0 +1,132 @@
+"""
+Normalization of compiled items before drawing or export:
+    * exact duplicates of pins, pinqs, texts and wires are dropped
+        (a wire with swapped ends is the same wire);
+    * collinear wire segments of the same width that touch or overlap
+        are merged into one segment.
+
+The picture stays the same. A duplicate is drawn again in the same place
+by its last copy, so only the last copies are kept. All wires of a layer
+are drawn in one color, so merged segments cover the same area.
+Source lines of TracedItemBuffer are kept (a merged wire gets the line
+of the segment it starts with).
+"""
+
+import math
+from collections import namedtuple
+
+from .items import *
+
+
+# Numbers of the dropped duplicates by kind and of the wire segments
+# removed by merging
+Report = namedtuple('report', ['pins', 'pinqs', 'texts', 'wires', 'merged'])
+
+# Precision of the direction and the offset of a line of a segment
+_DIGITS = 9
+
+
+def normalize(items):
+    """
+    Returns (normalized items, report).
+    """
+    traced = isinstance(items, TracedItemBuffer)
+    result = TracedItemBuffer() if traced else ItemBuffer()
+
+    def rows(kind, values):
+        if traced:
+            return list(zip(values, items.lines[kind]))
+        return [(value, 0) for value in values]
+
+    def add(add_item, kept):
+        for values, line in kept:
+            if traced:
+                result.line = line
+            add_item(*values)
+
+    add(result.add_board, rows('board', items.boards))
+
+    texts = rows('text', zip(*items.texts))
+    kept_texts = _unique(texts, lambda values: values)
+    add(result.add_text, kept_texts)
+
+    wires = rows('wire', zip(*items.wires))
+    kept_wires = _unique(wires, _wire_key)
+    merged_wires = _merge_wires(kept_wires)
+    add(result.add_wire, merged_wires)
+
+    pins = rows('pin', zip(*items.pins))
+    kept_pins = _unique(pins, lambda values: values)
+    add(result.add_pin, kept_pins)
+
+    pinqs = rows('pinq', zip(*items.pinqs))
+    kept_pinqs = _unique(pinqs, lambda values: values)
+    add(result.add_pinq, kept_pinqs)
+
+    report = Report(
+        pins=len(pins) - len(kept_pins),
+        pinqs=len(pinqs) - len(kept_pinqs),
+        texts=len(texts) - len(kept_texts),
+        wires=len(wires) - len(kept_wires),
+        merged=len(kept_wires) - len(merged_wires),
+    )
+    return result, report
+
+
+def _unique(rows, key):
+    # Keeping the last copies
+    seen = set()
+    kept = []
+    for row in reversed(rows):
+        value = key(row[0])
+        if value not in seen:
+            seen.add(value)
+            kept.append(row)
+    kept.reverse()
+    return kept
+
+
+def _wire_key(values):
+    x1, y1, x2, y2, width = values
+    return min((x1, y1), (x2, y2)), max((x1, y1), (x2, y2)), width
+
+
+def _merge_wires(rows):
+    # Segments are grouped by their lines and widths, the segments of
+    # a group are intervals of the parameter along the line
+    groups = {}
+    points = []
+
+    for values, line in rows:
+        x1, y1, x2, y2, width = values
+        length = math.hypot(x2 - x1, y2 - y1)
+        if not length:
+            points.append((values, line))
+            continue
+
+        ux, uy = (x2 - x1) / length, (y2 - y1) / length
+        rx, ry = round(ux, _DIGITS), round(uy, _DIGITS)
+        if rx < 0 or (rx == 0 and ry < 0):
+            ux, uy, rx, ry = -ux, -uy, -rx, -ry
+        key = (width, rx, ry, round(uy * x1 - ux * y1, _DIGITS))
+
+        t1, t2 = ux * x1 + uy * y1, ux * x2 + uy * y2
+        if t1 <= t2:
+            segment = (t1, t2, (x1, y1), (x2, y2), line)
+        else:
+            segment = (t2, t1, (x2, y2), (x1, y1), line)
+        groups.setdefault(key, []).append(segment)
+
+    merged = []
+    for (width, _, _, _), segments in groups.items():
+        segments.sort(key=lambda segment: segment[0])
+        _, end, first, last, line = segments[0]
+        for t1, t2, point1, point2, other_line in segments[1:]:
+            if t1 > end + 10 ** -_DIGITS:
+                merged.append(((*first, *last, width), line))
+                end, first, last, line = t2, point1, point2, other_line
+            elif t2 > end:
+                end, last = t2, point2
+        merged.append(((*first, *last, width), line))
+
+    return merged + points
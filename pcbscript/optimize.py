@@ -0,0 +1,571 @@
+"""
+Optimization of the graph of nodes between building and execution:
+    * constant propagation: the values of variables are followed along
+        all the paths of the graph (loops and macros too), a variable is
+        constant at a node if it has the same value on every path that
+        can reach the node;
+    * constant folding: constant variables and subexpressions with
+        constant operands are replaced with their values, calls of abs,
+        min, max, round, int, float and bool are folded too;
+    * dead branches: if-blocks with constant conditions are replaced with
+        the branch that runs, loops that never run, macros that are never
+        called and nodes that cannot be reached (after exit) are dropped;
+    * empty jumps: the jump over an else-branch that has become empty is
+        collapsed, assignments of constants to variables that nothing
+        reads anymore are dropped.
+An expression is evaluated by the same sandboxed evaluator as at run time
+and only when all its operands are known, so the result of the script is
+the same (an expression that fails is left to fail at run time).
+The graph keeps the shape of blocks the closure engine and batch loops
+expect. The pass is skipped if the graph has a jump it does not know.
+"""
+
+import ast
+import math
+from collections import namedtuple
+from heapq import heappush, heappop
+from functools import lru_cache
+
+from .nodes import *
+from .values import Number, Coord, GLOBALS, MAX_INT_BITS, compile_expr
+
+
+Report = namedtuple('report', ['before', 'after'])
+
+# Functions that are folded if their arguments are constant
+_FUNCTIONS = {'abs', 'min', 'max', 'round', 'int', 'float', 'bool'}
+
+# Powers with bigger exponents are left to run time
+_MAX_EXPONENT = 64
+
+_CONSTANT_TYPES = (int, float, bool, type(None))
+
+_VALUE_TYPES = (Number, Coord)
+
+# A variable with different values on different paths
+_VARYING = object()
+
+# Value of an expression that is not constant
+_UNKNOWN = object()
+
+
+class _Unsupported(Exception):
+    pass
+
+
+def optimize(nodes):
+    """
+    Returns (nodes, report), the report has the numbers of nodes before
+    and after. The nodes are changed in place.
+    """
+    before = len(nodes)
+    try:
+        steps = _parse_block(nodes, 0, len(nodes))
+    except _Unsupported:
+        return nodes, Report(before, before)
+
+    optimizer = _Optimizer(nodes, steps)
+    result = optimizer.run()
+    return result, Report(before, len(result))
+
+
+class _For:
+    def __init__(self, head, body, increment, back):
+        self.head = head
+        self.body = body
+        self.increment = increment
+        self.back = back
+
+
+class _If:
+    def __init__(self, head, body, else_index, else_body):
+        self.head = head
+        self.body = body
+        self.else_index = else_index
+        self.else_body = else_body
+
+
+class _MacroDef:
+    def __init__(self, head, body, exit):
+        self.head = head
+        self.body = body
+        self.exit = exit
+
+
+def _parse_block(nodes, start, end):
+    # Blocks are recognized the same way as in the closure engine, steps
+    # are indices of plain nodes or blocks
+    steps = []
+    index = start
+
+    while index < end:
+        node = nodes[index]
+        if not isinstance(node, JmpNode):
+            steps.append(index)
+            index += 1
+            continue
+
+        jmp = node.jmp
+        last = nodes[jmp - 1] if jmp is not None and index < jmp <= end \
+            else None
+
+        if node.expr is None and isinstance(last, MacroExitNode):
+            body = _parse_block(nodes, index + 1, jmp - 1)
+            steps.append(_MacroDef(index, body, jmp - 1))
+            index = jmp
+
+        elif node.expr is not None and isinstance(last, JmpNode) and \
+                last.jmp == index and jmp - 2 > index:
+            body = _parse_block(nodes, index + 1, jmp - 2)
+            steps.append(_For(index, body, jmp - 2, jmp - 1))
+            index = jmp
+
+        elif node.expr is not None and isinstance(last, JmpNode) and \
+                last.expr is None:
+            body = _parse_block(nodes, index + 1, jmp - 1)
+            else_body = None
+            if last.jmp is not None:
+                if not jmp <= last.jmp <= end:
+                    raise _Unsupported()
+                else_body = _parse_block(nodes, jmp, last.jmp)
+            steps.append(_If(index, body, jmp - 1, else_body))
+            index = last.jmp or jmp
+
+        else:
+            raise _Unsupported()
+
+    return steps
+
+
+class _Optimizer:
+    def __init__(self, nodes, steps):
+        self._nodes = nodes
+        self._steps = steps
+
+        # Calls returning from every macro
+        self._returns = {}
+        self._collect_returns(steps)
+
+    def run(self):
+        self._states = self._propagate()
+        steps = self._rewrite(self._steps)
+
+        names = set()
+        self._collect_names(steps, names)
+        result = []
+        entries = {}
+        self._flatten(steps, names, result, entries)
+
+        for index, node in enumerate(result):
+            if isinstance(node, MacroEnterNode):
+                node.jmp = entries[node.jmp]
+                node.idx = index + 1
+
+        return result
+
+    def _collect_returns(self, steps):
+        for step in steps:
+            if isinstance(step, _MacroDef):
+                entry = step.head + 1
+                self._returns[step.exit] = [
+                    node.idx for node in self._nodes
+                    if isinstance(node, MacroEnterNode) and node.jmp == entry
+                ]
+            for attr in ('body', 'else_body'):
+                if getattr(step, attr, None):
+                    self._collect_returns(getattr(step, attr))
+
+    def _propagate(self):
+        # States are dicts of variables known at the entry of every node
+        # (None if the node cannot be reached): a constant or _VARYING,
+        # variables that are not set yet are missing
+        nodes = self._nodes
+        count = len(nodes)
+        states = [None] * count
+        if not count:
+            return states
+
+        # Nodes are taken in their order, so a node is mostly reached by
+        # all its paths before it is visited
+        states[0] = {}
+        work = [0]
+        queued = {0}
+        while work:
+            index = heappop(work)
+            queued.discard(index)
+            for target, state in self._transfer(index, states[index]):
+                if target >= count:
+                    continue
+                old = states[target]
+                new = state if old is None else _merge(old, state)
+                if new is not old:
+                    states[target] = new
+                    if target not in queued:
+                        queued.add(target)
+                        heappush(work, target)
+
+        return states
+
+    def _transfer(self, index, state):
+        node = self._nodes[index]
+
+        if isinstance(node, ExitNode):
+            return []
+
+        if isinstance(node, AssignNode):
+            _, value = _fold_expr(node.expr.value,
+                                  _key(node.expr.value, state))
+            state = dict(state)
+            state[node.var_name] = _VARYING if value is _UNKNOWN else value
+            return [(index + 1, state)]
+
+        if isinstance(node, JmpNode):
+            if node.jmp is None:
+                return [(index + 1, state)]
+            if node.expr is None:
+                return [(node.jmp, state)]
+            _, value = _fold_expr(node.expr.value,
+                                  _key(node.expr.value, state))
+            if value is _UNKNOWN:
+                return [(node.jmp, state), (index + 1, state)]
+            return [(node.jmp if value else index + 1, state)]
+
+        if isinstance(node, MacroEnterNode):
+            return [(node.jmp, state)]
+
+        if isinstance(node, MacroExitNode):
+            return [(idx, state) for idx in self._returns.get(index, [])]
+
+        return [(index + 1, state)]
+
+    def _rewrite(self, steps, keep=False):
+        # Steps become nodes and blocks of nodes (tuples) with folded
+        # expressions, dead code is dropped
+        nodes = self._nodes
+        states = self._states
+        result = []
+
+        for step in steps:
+            if isinstance(step, int):
+                state = states[step]
+                if state is not None:
+                    _fold_node(nodes[step], state)
+                elif not keep:
+                    continue
+                result.append(nodes[step])
+                continue
+
+            state = states[step.head]
+            if state is None:
+                continue
+            head = nodes[step.head]
+
+            if isinstance(step, _MacroDef):
+                if not any(states[idx - 1] is not None
+                           for idx in self._returns[step.exit]):
+                    continue
+                result.append(('macro', head, self._rewrite(step.body),
+                               nodes[step.exit], step.head + 1))
+                continue
+
+            value = _fold_node(head, state)
+
+            if isinstance(step, _For):
+                # The loop never runs
+                if value is not _UNKNOWN and value:
+                    continue
+                result.append((
+                    'for', head, self._rewrite(step.body),
+                    self._rewrite([step.back - 1], keep=True),
+                    nodes[step.back],
+                ))
+
+            elif value is _UNKNOWN:
+                else_body = []
+                if step.else_body is not None:
+                    else_body = self._rewrite(step.else_body)
+                result.append(('if', head, self._rewrite(step.body),
+                               nodes[step.else_index], else_body))
+
+            # The condition is the one to skip the body
+            elif value:
+                if step.else_body is not None:
+                    result.extend(self._rewrite(step.else_body))
+            else:
+                result.extend(self._rewrite(step.body))
+
+        return result
+
+    def _collect_names(self, steps, names):
+        for step in steps:
+            if isinstance(step, tuple):
+                _, head, *blocks = step
+                names.update(_node_names(head))
+                for block in blocks:
+                    if isinstance(block, list):
+                        self._collect_names(block, names)
+            else:
+                names.update(_node_names(step))
+
+    def _flatten(self, steps, names, result, entries):
+        for step in steps:
+            if not isinstance(step, tuple):
+                # Assignment nothing reads
+                if isinstance(step, AssignNode) and \
+                        step.var_name not in names and \
+                        _literal_value(step.expr.value) is not _UNKNOWN:
+                    continue
+                result.append(step)
+                continue
+
+            kind, head = step[:2]
+            start = len(result)
+            result.append(head)
+
+            if kind == 'for':
+                _, _, body, increment, back = step
+                self._flatten(body, names, result, entries)
+                result.extend(increment)
+                back.jmp = start
+                result.append(back)
+                head.jmp = len(result)
+
+            elif kind == 'if':
+                _, _, body, else_node, else_body = step
+                self._flatten(body, names, result, entries)
+                result.append(else_node)
+                head.jmp = len(result)
+                self._flatten(else_body, names, result, entries)
+                else_node.jmp = len(result) if len(result) > head.jmp \
+                    else None
+
+            else:
+                _, _, body, exit, entry = step
+                entries[entry] = len(result)
+                self._flatten(body, names, result, entries)
+                result.append(exit)
+                head.jmp = len(result)
+
+
+def _merge(old, new):
+    # Returns old if nothing changes
+    if old is new:
+        return old
+    result = None
+    for name, a in old.items():
+        # Values mostly come to both states from the same assignment
+        b = new.get(name, _UNKNOWN)
+        if a is b or a is _VARYING:
+            continue
+        if b is _UNKNOWN or b is _VARYING or type(a) is not type(b) or \
+                repr(a) != repr(b):
+            if result is None:
+                result = dict(old)
+            result[name] = _VARYING
+
+    # Variables that are not set in old
+    for name in new.keys() - old.keys():
+        if result is None:
+            result = dict(old)
+        result[name] = _VARYING
+
+    return old if result is None else result
+
+
+def _key(expr, state):
+    # States of the variables of the expression: a constant with its type,
+    # 'v' for varying or 'u' for unset
+    key = []
+    for name in _names(expr):
+        value = state.get(name, _UNKNOWN)
+        if value is _UNKNOWN:
+            key.append((name, 'u'))
+        elif value is _VARYING:
+            key.append((name, 'v'))
+        else:
+            key.append((name, (type(value).__name__, repr(value), value)))
+    return tuple(key)
+
+
+def _values(node):
+    # Attributes of the node that are values with expressions
+    return [(name, value) for name, value in vars(node).items()
+            if type(value) in _VALUE_TYPES or type(value) is tuple and
+            value and all(type(coord) is Coord for coord in value)]
+
+
+def _value_exprs(value):
+    if isinstance(value, Number):
+        return [value.value]
+    if isinstance(value, Coord):
+        return [value.x, value.y]
+    return [expr for coord in value for expr in (coord.x, coord.y)]
+
+
+def _node_names(node):
+    names = set()
+    for _, value in _values(node):
+        for expr in _value_exprs(value):
+            names.update(_names(expr))
+    return names
+
+
+def _fold_node(node, state):
+    # Folds the expressions of the node, returns the value of the
+    # condition of a jump (or _UNKNOWN)
+    result = _UNKNOWN
+    for name, value in _values(node):
+        if isinstance(value, Number):
+            expr, result = _fold_expr(value.value, _key(value.value, state))
+            if expr != value.value:
+                setattr(node, name, Number(expr))
+        elif isinstance(value, Coord):
+            setattr(node, name, _fold_coord(value, state))
+        else:
+            setattr(node, name,
+                    tuple(_fold_coord(coord, state) for coord in value))
+    return result
+
+
+def _fold_coord(coord, state):
+    x, _ = _fold_expr(coord.x, _key(coord.x, state))
+    y, _ = _fold_expr(coord.y, _key(coord.y, state))
+    if x == coord.x and y == coord.y:
+        return coord
+    return Coord(x, y)
+
+
+@lru_cache(maxsize=65536)
+def _names(expr):
+    # Sorted, so keys of the same variables are the same
+    tree = ast.parse(expr.strip(), mode='eval')
+    return tuple(sorted({node.id for node in ast.walk(tree)
+                         if isinstance(node, ast.Name)}))
+
+
+@lru_cache(maxsize=65536)
+def _fold_expr(expr, key):
+    """
+    Returns the folded expression (the same string if nothing is folded)
+    and its value (_UNKNOWN if it is not constant).
+    """
+    constants = {}
+    functions = set()
+    for name, state in key:
+        if isinstance(state, tuple):
+            constants[name] = state[2]
+        elif state == 'u' and name in _FUNCTIONS:
+            functions.add(name)
+
+    tree = ast.parse(expr.strip(), mode='eval')
+    folder = _Folder(constants, functions)
+    body = folder.visit(tree.body)
+    if folder.changed:
+        expr = ast.unparse(body)
+    return expr, _literal_value(body)
+
+
+class _Folder(ast.NodeTransformer):
+    def __init__(self, constants, functions):
+        self._constants = constants
+        self._functions = functions
+        self.changed = False
+
+    def visit_Name(self, node):
+        if node.id not in self._constants:
+            return node
+        self.changed = True
+        return _literal(self._constants[node.id])
+
+    def visit_IfExp(self, node):
+        node.test = self.visit(node.test)
+        test = _literal_value(node.test)
+        if test is _UNKNOWN:
+            return self.generic_visit(node)
+        self.changed = True
+        return self.visit(node.body if test else node.orelse)
+
+    def visit_BoolOp(self, node):
+        # Leading operands that do not decide the result are dropped,
+        # the first one that decides it is the result
+        values = [self.visit(value) for value in node.values]
+        is_and = isinstance(node.op, ast.And)
+        while values:
+            value = _literal_value(values[0])
+            if value is _UNKNOWN:
+                break
+            if len(values) == 1 or bool(value) != is_and:
+                self.changed = True
+                return values[0]
+            values.pop(0)
+            self.changed = True
+        if len(values) == 1:
+            return values[0]
+        node.values = values
+        return node
+
+    def generic_visit(self, node):
+        node = super().generic_visit(node)
+        if not self._can_fold(node):
+            return node
+        try:
+            value = eval(compile_expr(ast.unparse(node)), GLOBALS, {})
+        except Exception:
+            return node
+        if not _is_constant(value):
+            return node
+        self.changed = True
+        return _literal(value)
+
+    def _can_fold(self, node):
+        if isinstance(node, ast.UnaryOp):
+            return _literal_value(node) is _UNKNOWN and \
+                _literal_value(node.operand) is not _UNKNOWN
+        if isinstance(node, ast.BinOp):
+            if isinstance(node.op, (ast.LShift, ast.RShift)):
+                return False
+            left = _literal_value(node.left)
+            right = _literal_value(node.right)
+            if left is _UNKNOWN or right is _UNKNOWN:
+                return False
+            return not isinstance(node.op, ast.Pow) or \
+                abs(right or 0) <= _MAX_EXPONENT
+        if isinstance(node, ast.Compare):
+            return all(_literal_value(item) is not _UNKNOWN
+                       for item in [node.left, *node.comparators])
+        if isinstance(node, ast.Call):
+            return isinstance(node.func, ast.Name) and \
+                node.func.id in self._functions and not node.keywords and \
+                all(_literal_value(arg) is not _UNKNOWN for arg in node.args)
+        return False
+
+
+def _is_constant(value):
+    # Too big integers are left to fail at run time
+    if type(value) not in _CONSTANT_TYPES:
+        return False
+    if type(value) is int:
+        return value.bit_length() <= MAX_INT_BITS
+    return not isinstance(value, float) or math.isfinite(value)
+
+
+def _literal(value):
+    if type(value) in (int, float) and \
+            (value < 0 or math.copysign(1, value) < 0):
+        return ast.UnaryOp(ast.USub(), ast.Constant(-value))
+    return ast.Constant(value)
+
+
+def _literal_value(node):
+    # Value of a literal made by _literal (or written so), or _UNKNOWN
+    if isinstance(node, str):
+        node = ast.parse(node.strip(), mode='eval').body
+    if isinstance(node, ast.Constant):
+        return node.value if _is_constant(node.value) else _UNKNOWN
+    if isinstance(node, ast.UnaryOp) and \
+            isinstance(node.op, (ast.USub, ast.UAdd)) and \
+            isinstance(node.operand, ast.Constant) and \
+            type(node.operand.value) in (int, float):
+        value = node.operand.value
+        return -value if isinstance(node.op, ast.USub) else +value
+    return _UNKNOWN
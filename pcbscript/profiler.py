@@ -0,0 +1,190 @@
+"""
+Profiler executes the graph of nodes as the interpreter loop of the
+compiler does, and measures every node: the time of node.exec, the part
+of it spent evaluating expressions and the number of items the node adds.
+The measurements are summed up by the source lines of the nodes and by
+the stacks of macro calls that lead to them, so a profile tells which
+lines make a board slow to compile and through which macros they are
+reached.
+
+A profile is reported as rows of lines (sortable), as JSON or as
+collapsed stacks ("frame;frame;frame value" lines, the input format of
+flamegraph.pl, inferno and speedscope), where the frames are the macro
+calls and the leaf is the line, the value is the time in microseconds.
+"""
+
+from copy import copy
+from time import perf_counter
+from collections import namedtuple
+
+from .nodes import *
+from .values import Number, Coord
+
+
+LineProfile = namedtuple('line_profile',
+                         ['line', 'count', 'time', 'eval_time', 'items'])
+LineProfile.__qualname__ = 'LineProfile'
+
+# Keys of sorting, all but line sort from the biggest
+SORT_KEYS = {
+    'time': lambda row: -row.time,
+    'eval': lambda row: -row.eval_time,
+    'count': lambda row: -row.count,
+    'items': lambda row: -row.items,
+    'line': lambda row: row.line or 0,
+}
+
+
+class Profile:
+    """
+    Result of profiling. `lines` are LineProfile by the source lines,
+    `stacks` are the times (seconds) by the stacks: tuples of macro frames
+    (macro name, line of the call) ending with the line of the node.
+    """
+
+    def __init__(self, lines, stacks):
+        self.lines = lines
+        self.stacks = stacks
+
+    @property
+    def time(self):
+        return sum(row.time for row in self.lines.values())
+
+    def rows(self, sort='time'):
+        # Ties are in the order of lines
+        rows = sorted(self.lines.values(), key=SORT_KEYS['line'])
+        return sorted(rows, key=SORT_KEYS[sort])
+
+    def to_json(self, sort='time', sources=None):
+        return {
+            'time': self.time,
+            'lines': [
+                dict(row._asdict(), source=_source(sources, row.line))
+                for row in self.rows(sort)
+            ],
+            'stacks': [
+                {
+                    'frames': [{'macro': name, 'line': line}
+                               for name, line in stack[:-1]],
+                    'line': stack[-1],
+                    'time': time,
+                }
+                for stack, time in self.stacks.items()
+            ],
+        }
+
+    def collapsed(self, root='script', sources=None):
+        """
+        Yields the lines of collapsed stacks.
+        """
+        for stack, time in self.stacks.items():
+            frames = [root]
+            frames.extend(f"{name} (line {line})" for name, line in stack[:-1])
+            line = stack[-1]
+            source = _source(sources, line)
+            frames.append(f"{line}: {source}" if source else f"{line}")
+            value = round(time * 1e6)
+            if value:
+                yield ';'.join(frame.replace(';', ',')
+                               for frame in frames) + f" {value}"
+
+
+class Profiler:
+    def __init__(self, trace=False, budget=None):
+        self.trace = trace
+        self.budget = budget
+
+    def run(self, nodes, items, scope, motion_stack, macro_stack, options):
+        """
+        Executes the nodes and returns Profile.
+        """
+        # Time of the expressions evaluated by the current node
+        clock = [0.0]
+        nodes = [_timed_node(node, clock) for node in nodes]
+
+        trace = self.trace
+        budget = self.budget
+        lines = {}
+        stacks = {}
+        frames = ()
+        index = 0
+
+        while index < len(nodes):
+            node = nodes[index]
+
+            # Leave if ExitNode reached
+            if isinstance(node, ExitNode):
+                break
+
+            if budget is not None:
+                budget.spend()
+            if trace:
+                items.line = node.line
+
+            # Execute the node
+            count = len(items)
+            clock[0] = 0.0
+            started = perf_counter()
+            jmp = node.exec(items, scope, motion_stack, macro_stack, options)
+            elapsed = perf_counter() - started
+
+            line = node.line
+            row = lines.get(line)
+            if row is None:
+                row = lines[line] = [0, 0.0, 0.0, 0]
+            row[0] += 1
+            row[1] += elapsed
+            row[2] += clock[0]
+            row[3] += len(items) - count
+
+            stack = frames + (line,)
+            stacks[stack] = stacks.get(stack, 0.0) + elapsed
+
+            if isinstance(node, MacroEnterNode):
+                frames = frames + ((node.name, line),)
+            elif isinstance(node, MacroExitNode):
+                frames = frames[:-1]
+
+            # Change index
+            index = jmp if jmp is not None else (index + 1)
+
+        return Profile(
+            {line: LineProfile(line, *row) for line, row in lines.items()},
+            stacks,
+        )
+
+
+class _TimedValue:
+    # Value that adds the time of its evaluations to the clock
+    def __init__(self, value, clock):
+        self.value = value
+        self._clock = clock
+
+    def eval(self, scope={}):
+        started = perf_counter()
+        result = self.value.eval(scope)
+        self._clock[0] += perf_counter() - started
+        return result
+
+
+def _timed_node(node, clock):
+    # Copy of the node with the values timed
+    timed = None
+    for name, value in vars(node).items():
+        if isinstance(value, (Number, Coord)):
+            value = _TimedValue(value, clock)
+        elif isinstance(value, tuple) and value and \
+                all(isinstance(coord, Coord) for coord in value):
+            value = tuple(_TimedValue(coord, clock) for coord in value)
+        else:
+            continue
+        if timed is None:
+            timed = copy(node)
+        setattr(timed, name, value)
+    return timed or node
+
+
+def _source(sources, line):
+    if sources is None or not line or line > len(sources):
+        return None
+    return sources[line - 1].split('#', 1)[0].strip()
@@ -0,0 +1,366 @@
+"""
+RasterDrawer draws items (ItemBuffer) straight into a raster image at the
+requested resolution with Pillow, so there is no SVG to serialize, parse
+and resample. The picture consists of two colors only, so it is drawn as
+a mask (the color is 255, the background is 0) at `supersample` times the
+resolution, reduced with a box filter for antialiasing and colorized in
+the end.
+
+For very large boards and high DPI the picture can be rendered in
+horizontal strips of `strip` pixels, so the memory is bounded by the size
+of a strip instead of the size of the board. Items are bucketed by the
+strips they cross, so each strip draws only its own items, and the strips
+can be rendered by a pool of `workers` processes. PNG sheets are written
+row by row as the strips come, other formats are assembled in memory.
+
+Coordinates are rounded to whole (supersampled) pixels of the sheet before
+they are shifted to a strip, and every strip is drawn with OVERLAP rows
+more on both sides and cropped, so the strips are exactly the parts of
+the picture rendered at once.
+"""
+
+import math
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+
+from .items import ItemBuffer
+
+
+# Rows drawn above and below a strip and cropped away
+OVERLAP = 4
+
+class RasterDrawer:
+    def __init__(self, color=(128, 196, 255), bg_color=(0, 16, 24),
+                 supersample=2, strip=0, workers=1):
+        self._color = color
+        self._bg_color = bg_color
+        self._supersample = supersample
+        self._strip = strip
+        self._workers = workers
+        self._items = None
+
+    def draw(self, items):
+        self._items = items
+
+    def save(self, path, dpi=300):
+        if self._items is None or not self._items.boards:
+            return
+
+        if self._strip:
+            board = self._items.boards[-1]
+            scale = dpi / 10
+            size = (round(board.width * scale), round(board.height * scale))
+            self._save_strips(path, dpi, 1.0, size, (0, 0))
+        else:
+            self.render(dpi).save(path)
+
+    def render(self, dpi, coef=1.0):
+        # Board units are 0.1 inch
+        board = self._items.boards[-1]
+        scale = dpi / 10 * coef
+        size = (round(board.width * scale), round(board.height * scale))
+
+        mask = _render_mask(self._items, size, 0, scale, self._supersample)
+        return self._colorize(mask)
+
+    def render_strips(self, dpi, coef=1.0):
+        """
+        Yields (y, image) for the horizontal strips of the board from top
+        to bottom. Only `workers` * 2 strips are kept in memory at a time.
+        """
+        board = self._items.boards[-1]
+        scale = dpi / 10 * coef
+        width = round(board.width * scale)
+        height = round(board.height * scale)
+        strip = self._strip or height
+
+        tasks = [
+            (items, (width, min(strip, height - y)), y, scale,
+             self._supersample)
+            for y, items in zip(range(0, height, strip),
+                                self._split_items(scale, height, strip))
+        ]
+
+        if self._workers > 1:
+            with ProcessPoolExecutor(self._workers) as executor:
+                window = self._workers * 2
+                futures = [executor.submit(_render_mask, *task)
+                           for task in tasks[:window]]
+                for index, task in enumerate(tasks):
+                    mask = futures[index].result()
+                    futures[index] = None
+                    if index + window < len(tasks):
+                        futures.append(executor.submit(
+                            _render_mask, *tasks[index + window]
+                        ))
+                    yield task[2], self._colorize(mask)
+        else:
+            for task in tasks:
+                yield task[2], self._colorize(_render_mask(*task))
+
+    def prepare_a4(self, path, dpi, offset, coef=1.0):
+        # Inserting into an A4 sheet
+        size_a4 = (
+            round(8.3 * dpi),
+            round(11.7 * dpi),
+        )
+        offset_a4 = (
+            round(offset[0] * dpi * coef),
+            round(offset[1] * dpi * coef),
+        )
+
+        if self._strip:
+            self._save_strips(path, dpi, coef, size_a4, offset_a4)
+            return
+
+        image_a4 = Image.new("RGB", size=size_a4, color=(255, 255, 255))
+        image_a4.paste(self.render(dpi, coef), offset_a4)
+
+        # Saving the result
+        image_a4.save(path)
+
+    def _save_strips(self, path, dpi, coef, size, offset):
+        # Strips are pasted onto a white sheet of the size at the offset
+        if path.lower().endswith('.png'):
+            self._stream_png(path, dpi, coef, size, offset)
+            return
+
+        sheet = Image.new("RGB", size=size, color=(255, 255, 255))
+        for y, image in self.render_strips(dpi, coef):
+            sheet.paste(image, (offset[0], offset[1] + y))
+        sheet.save(path)
+
+    def _stream_png(self, path, dpi, coef, size, offset):
+        width, height = size
+        row = 0
+
+        with open(path, 'wb') as f:
+            writer = _PngWriter(f, width, height)
+
+            for y, image in self.render_strips(dpi, coef):
+                top = offset[1] + y
+                bottom = min(top + image.size[1], height)
+                if bottom <= row:
+                    continue
+                if top >= height:
+                    break
+
+                writer.write_blank(top - row)
+                line = Image.new("RGB", (width, image.size[1]),
+                                 color=(255, 255, 255))
+                line.paste(image, (offset[0], 0))
+                start = max(row, top)
+                writer.write(line.crop((0, start - top, width, bottom - top)))
+                row = bottom
+
+            writer.write_blank(height - row)
+            writer.close()
+
+    def _colorize(self, mask):
+        return ImageOps.colorize(mask, self._bg_color, self._color)
+
+    def _split_items(self, scale, height, strip):
+        """
+        Spatial query of the items by strips: every strip gets an ItemBuffer
+        with the items whose bounding box crosses the strip.
+        """
+        count = max(1, math.ceil(height / strip))
+        buffers = [ItemBuffer() for _ in range(count)]
+        items = self._items
+        gap = items.boards[-1].gap or 0
+
+        # 1 pixel is added to the boxes for antialiasing and rounding
+        margin = (1 + OVERLAP) / scale
+
+        def spread(add, item, top, bottom):
+            first = max(0, int((top - margin) * scale // strip))
+            last = min(count - 1, int((bottom + margin) * scale // strip))
+            for index in range(first, last + 1):
+                add(buffers[index], *item)
+
+        for buffer in buffers:
+            buffer.boards.extend(items.boards)
+        for item in zip(*items.texts):
+            spread(ItemBuffer.add_text, item, item[2] - item[3],
+                   item[2] + 0.5 * item[3])
+        for item in zip(*items.wires):
+            r = 0.5 * item[4] + gap
+            spread(ItemBuffer.add_wire, item, min(item[1], item[3]) - r,
+                   max(item[1], item[3]) + r)
+        for item in zip(*items.pins):
+            r = 0.5 * item[2] + gap
+            spread(ItemBuffer.add_pin, item, item[1] - r, item[1] + r)
+        for item in zip(*items.pinqs):
+            r = 0.5 * item[2] + gap
+            spread(ItemBuffer.add_pinq, item, item[1] - r, item[1] + r)
+
+        return buffers
+
+    @classmethod
+    def _draw_mask(cls, draw, items, scale, dy):
+        gap = items.boards[-1].gap
+
+        # Gap layer
+        for board in items.boards:
+            cls._draw_board(draw, board, scale, dy)
+        if gap:
+            cls._draw_wires(draw, items, 2 * gap, 0, scale, dy)
+            cls._draw_pins(draw, items, gap, scale, dy)
+            cls._draw_pinqs(draw, items, gap, scale, dy)
+
+        # Main layer
+        cls._draw_texts(draw, items, 0 if gap else 255, scale, dy)
+        cls._draw_wires(draw, items, 0, 255, scale, dy)
+        cls._draw_pins(draw, items, None, scale, dy)
+        cls._draw_pinqs(draw, items, None, scale, dy)
+
+    @classmethod
+    def _draw_board(cls, draw, board, scale, dy):
+        width = round(board.width * scale)
+        top = -dy
+        bottom = round(board.height * scale) - dy
+        draw.rectangle((0, top, width, bottom),
+                       fill=255 if board.gap else 0)
+
+        # Drawing frame if gap
+        if board.gap:
+            gap = round(board.gap * scale)
+            draw.rectangle((0, top, gap, bottom), fill=0)
+            draw.rectangle((0, top, width, top + gap), fill=0)
+            draw.rectangle((width - gap, top, width, bottom), fill=0)
+            draw.rectangle((0, bottom - gap, width, bottom), fill=0)
+
+    @classmethod
+    def _draw_texts(cls, draw, items, fill, scale, dy):
+        for text, x, y, height in zip(*items.texts):
+            font = _get_font(max(1, round(height * scale)))
+            draw.text(_point(x * scale, y * scale, dy), text, fill=fill,
+                      font=font, anchor='ls')
+
+    @classmethod
+    def _draw_wires(cls, draw, items, extra, fill, scale, dy):
+        for x1, y1, x2, y2, width in zip(*items.wires):
+            radius = 0.5 * (width + extra) * scale
+            x1, y1, x2, y2 = x1 * scale, y1 * scale, x2 * scale, y2 * scale
+
+            length = math.hypot(x2 - x1, y2 - y1)
+            if length:
+                nx = (y1 - y2) / length * radius
+                ny = (x2 - x1) / length * radius
+                draw.polygon([
+                    _point(x1 + nx, y1 + ny, dy), _point(x2 + nx, y2 + ny, dy),
+                    _point(x2 - nx, y2 - ny, dy), _point(x1 - nx, y1 - ny, dy),
+                ], fill=fill)
+
+            draw.ellipse(_square(x1, y1, radius, dy), fill=fill)
+            draw.ellipse(_square(x2, y2, radius, dy), fill=fill)
+
+    @classmethod
+    def _draw_pins(cls, draw, items, gap, scale, dy):
+        for x, y, dout, din in zip(*items.pins):
+            x, y = x * scale, y * scale
+            if gap is not None:
+                r = (0.5 * dout + gap) * scale
+                draw.ellipse(_square(x, y, r, dy), fill=0)
+            else:
+                r = 0.5 * dout * scale
+                draw.ellipse(_square(x, y, r, dy), fill=255)
+                r = 0.5 * din * scale
+                draw.ellipse(_square(x, y, r, dy), fill=0)
+
+    @classmethod
+    def _draw_pinqs(cls, draw, items, gap, scale, dy):
+        for x, y, dout, din in zip(*items.pinqs):
+            x, y = x * scale, y * scale
+            if gap is not None:
+                h = (0.5 * dout + gap) * scale
+                draw.rectangle(_square(x, y, h, dy), fill=0)
+            else:
+                h = 0.5 * dout * scale
+                draw.rectangle(_square(x, y, h, dy), fill=255)
+                r = 0.5 * din * scale
+                draw.ellipse(_square(x, y, r, dy), fill=0)
+
+
+def _point(x, y, dy):
+    # Pillow clips shapes with fractional coordinates differently at
+    # different offsets, whole pixels are drawn the same in every strip
+    return round(x), round(y) - dy
+
+
+def _square(x, y, r, dy):
+    return round(x - r), round(y - r) - dy, round(x + r), round(y + r) - dy
+
+
+def _render_mask(items, size, y, scale, supersample):
+    # Mask of the strip of the board starting from the row y
+    k = supersample
+    height = size[1] + 2 * OVERLAP
+    mask = Image.new('L', (size[0] * k, height * k), 0)
+    RasterDrawer._draw_mask(ImageDraw.Draw(mask), items, scale * k,
+                            (y - OVERLAP) * k)
+    if k > 1:
+        mask = mask.reduce(k)
+    # Cropped by pasting, crop() takes big boards for decompression bombs
+    strip = Image.new('L', size, 0)
+    strip.paste(mask, (0, -OVERLAP))
+    return strip
+
+
+class _PngWriter:
+    """
+    Minimal PNG encoder for RGB images that are written row by row.
+    """
+
+    def __init__(self, f, width, height):
+        self._f = f
+        self._width = width
+        self._compressor = zlib.compressobj()
+        f.write(b'\x89PNG\r\n\x1a\n')
+        self._write_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height,
+                                               8, 2, 0, 0, 0))
+
+    def write(self, image):
+        data = image.tobytes()
+        stride = self._width * 3
+        self._write_data(b''.join(
+            b'\x00' + data[offset:offset + stride]
+            for offset in range(0, len(data), stride)
+        ))
+
+    def write_blank(self, rows):
+        row = b'\x00' + b'\xff' * (self._width * 3)
+        for offset in range(0, rows, 64):
+            self._write_data(row * min(64, rows - offset))
+
+    def close(self):
+        self._write_chunk(b'IDAT', self._compressor.flush())
+        self._write_chunk(b'IEND', b'')
+
+    def _write_data(self, data):
+        compressed = self._compressor.compress(data)
+        if compressed:
+            self._write_chunk(b'IDAT', compressed)
+
+    def _write_chunk(self, kind, data):
+        self._f.write(struct.pack('>I', len(data)))
+        self._f.write(kind)
+        self._f.write(data)
+        self._f.write(struct.pack('>I', zlib.crc32(kind + data)))
+
+
+_fonts = {}
+
+
+def _get_font(size):
+    font = _fonts.get(size)
+    if font is None:
+        try:
+            font = ImageFont.truetype('DejaVuSansMono-Bold.ttf', size)
+        except OSError:
+            font = ImageFont.load_default(size)
+        _fonts[size] = font
+    return font
@@ -0,0 +1,74 @@
+"""
+Runner executes an action of the command line for many files. Every file
+is a job (a pair of input and output paths), the jobs are run in a pool
+of processes. Where possible the processes are forked, so they share
+the modules already imported by the parent process instead of importing
+them again. The messages of the actions are suppressed, the time and
+the error of every job are collected.
+"""
+
+import os
+import argparse
+import multiprocessing
+from io import StringIO
+from time import time
+from itertools import repeat
+from contextlib import redirect_stdout
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+
+Result = namedtuple('result', ['input', 'output', 'time', 'error'])
+Result.__qualname__ = 'Result'
+
+
+def read_manifest(path):
+    """
+    Reads jobs from a manifest: a line is an input path, optionally
+    followed by an output path, # starts a comment. Relative input paths
+    are relative to the manifest. Returns pairs (input, output or None).
+    """
+    base = os.path.dirname(path)
+    jobs = []
+    with open(path) as f:
+        for line in f:
+            parts = line.split('#', 1)[0].split()
+            if not parts:
+                continue
+            if len(parts) > 2:
+                raise ValueError(f"invalid manifest line: {line.strip()}")
+            output = parts[1] if len(parts) > 1 else None
+            jobs.append((os.path.join(base, parts[0]), output))
+    return jobs
+
+
+def run_jobs(action, args, jobs, processes=1):
+    """
+    Yields Result of every job in the order of jobs. The action is called
+    with a copy of args where input and output are set to the job paths.
+    """
+    if processes == 1 or len(jobs) < 2:
+        yield from map(_run_job, repeat(action), repeat(args), jobs)
+        return
+
+    context = None
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+
+    with ProcessPoolExecutor(processes, mp_context=context) as executor:
+        yield from executor.map(_run_job, repeat(action), repeat(args), jobs)
+
+
+def _run_job(action, args, job):
+    job_args = argparse.Namespace(**vars(args))
+    job_args.input, job_args.output = job
+
+    started = time()
+    error = None
+    try:
+        with redirect_stdout(StringIO()):
+            action(job_args)
+    except (Exception, SystemExit) as exc:
+        error = f"{exc.__class__.__name__}: {exc}"
+
+    return Result(job[0], job[1], time() - started, error)
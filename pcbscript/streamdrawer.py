@@ -0,0 +1,159 @@
+"""
+StreamDrawer is a lightweight alternative to Drawer. It produces the same
+picture (colors, gaps and the order of layers), but writes SVG text right
+into a file or a buffer as it goes through the items, without building
+svgwrite elements or an XML tree in memory. Numbers are written with
+a fixed precision of 0.01 pixel.
+"""
+
+import math
+from io import StringIO
+from xml.sax.saxutils import escape
+
+from .clearance import clearance_paths, frame_path
+
+
+_HEADER = '<?xml version="1.0" encoding="utf-8" ?>\n' \
+          '<svg baseProfile="tiny" height="100%%" version="1.2" ' \
+          'viewBox="0 0 %.2f %.2f" width="100%%" ' \
+          'xmlns="http://www.w3.org/2000/svg" ' \
+          'xmlns:ev="http://www.w3.org/2001/xml-events" ' \
+          'xmlns:xlink="http://www.w3.org/1999/xlink"><defs />'
+_FOOTER = '</svg>\n'
+_RECT = '<rect fill="%s" height="%.2f" width="%.2f" x="%.2f" y="%.2f" />'
+_ROTATED_RECT = '<rect fill="%s" height="%.2f" ' \
+                'transform="rotate(%.2f %.2f,%.2f)" ' \
+                'width="%.2f" x="%.2f" y="%.2f" />'
+_PATH = '<path d="%s" fill="%s" />'
+_CIRCLE = '<circle cx="%.2f" cy="%.2f" fill="%s" r="%.2f" />'
+_TEXT = '<text fill="%s" font-family="monospace" font-size="%.2f" ' \
+        'font-weight="bold" x="%.2f" y="%.2f">%s</text>'
+
+
+class StreamDrawer:
+    def __init__(self, scale=100, color=(128, 196, 255), bg_color=(0, 16, 24),
+                 merge_gaps=False):
+        self._scale = scale
+        self._merge_gaps = merge_gaps
+        self._color = 'rgb(%d,%d,%d)' % color
+        self._bg_color = 'rgb(%d,%d,%d)' % bg_color
+        self._items = None
+
+    def draw(self, items):
+        self._items = items
+
+    def save(self, path):
+        if self._items is not None and self._items.boards:
+            with open(path, 'w') as f:
+                self.write(f)
+
+    def tostring(self):
+        buffer = StringIO()
+        self.write(buffer)
+        return buffer.getvalue()
+
+    def write(self, f):
+        items = self._items
+        if items is None or not items.boards:
+            raise ValueError("nothing to draw: the script has no board")
+        board = items.boards[-1]
+        gap = board.gap
+
+        f.write(_HEADER % (board.width * self._scale,
+                           board.height * self._scale))
+
+        # Gap layer
+        for board in items.boards:
+            self._write_board(f, board)
+        if gap and self._merge_gaps:
+            for d in clearance_paths(items, gap, self._scale):
+                f.write(_PATH % (d, self._bg_color))
+        elif gap:
+            self._write_wires(f, items, 2 * gap, self._bg_color)
+            self._write_pins(f, items, gap)
+            self._write_pinqs(f, items, gap)
+
+        # Main layer
+        self._write_texts(f, items, self._bg_color if gap else self._color)
+        self._write_wires(f, items, 0, self._color)
+        self._write_pins(f, items, None)
+        self._write_pinqs(f, items, None)
+
+        f.write(_FOOTER)
+
+    def _write_board(self, f, board):
+        scale = self._scale
+        width = board.width * scale
+        height = board.height * scale
+        color = self._color if board.gap else self._bg_color
+
+        f.write(_RECT % (color, height, width, 0, 0))
+
+        # Drawing frame if gap
+        if board.gap and self._merge_gaps:
+            f.write(_PATH % (frame_path(board, scale), self._bg_color))
+        elif board.gap:
+            gap = board.gap * scale
+            bg_color = self._bg_color
+            f.write(_RECT % (bg_color, height, gap, 0, 0))
+            f.write(_RECT % (bg_color, gap, width, 0, 0))
+            f.write(_RECT % (bg_color, height, gap, width - gap, 0))
+            f.write(_RECT % (bg_color, gap, width, 0, height - gap))
+
+    def _write_texts(self, f, items, color):
+        scale = self._scale
+        f.writelines(
+            _TEXT % (color, height * scale, x * scale, y * scale,
+                     escape(text))
+            for text, x, y, height in zip(*items.texts)
+        )
+
+    def _write_wires(self, f, items, extra, color):
+        scale = self._scale
+        write = f.write
+
+        for x1, y1, x2, y2, width in zip(*items.wires):
+            width = (width + extra) * scale
+            x1, y1, x2, y2 = x1 * scale, y1 * scale, x2 * scale, y2 * scale
+            length = ((x1 - x2)**2 + (y1 - y2)**2)**0.5
+            angle = math.atan2(y2 - y1, x2 - x1) * 180 / math.pi
+            radius = 0.5 * width
+
+            write(_ROTATED_RECT % (color, width, angle, x1, y1,
+                                   length, x1, y1 - radius))
+            write(_CIRCLE % (x1, y1, color, radius))
+            write(_CIRCLE % (x2, y2, color, radius))
+
+    def _write_pins(self, f, items, gap):
+        scale = self._scale
+        write = f.write
+        color = self._color
+        bg_color = self._bg_color
+
+        for x, y, dout, din in zip(*items.pins):
+            x, y = x * scale, y * scale
+            if gap is not None:
+                write(_CIRCLE % (x, y, bg_color, (0.5 * dout + gap) * scale))
+            else:
+                write(_CIRCLE % (x, y, color, 0.5 * dout * scale))
+                write(_CIRCLE % (x, y, bg_color, 0.5 * din * scale))
+
+    def _write_pinqs(self, f, items, gap):
+        scale = self._scale
+        write = f.write
+        color = self._color
+        bg_color = self._bg_color
+
+        for x, y, dout, din in zip(*items.pinqs):
+            if gap is not None:
+                size = (dout + 2 * gap) * scale
+                write(_RECT % (bg_color, size, size,
+                               (x - 0.5 * dout - gap) * scale,
+                               (y - 0.5 * dout - gap) * scale))
+            else:
+                size = dout * scale
+                write(_RECT % (color, size, size,
+                               (x - 0.5 * dout) * scale,
+                               (y - 0.5 * dout) * scale))
+                write(_CIRCLE % (x * scale, y * scale, bg_color,
+                                 0.5 * din * scale))
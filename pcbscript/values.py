@@ -6,8 +6,105 @@ There are values that can be used in pcbscript:
 
 Each value can be represented as an expression (basically a Python expression)
 that can be evaluated (with eval-function) in the end of compilation process.
+Expressions are compiled into code objects once, when the value is built,
+and the code objects are cached by their source text, so the same expression
+met again (in another line, another compilation or on a redraw in watch mode)
+is not parsed twice.
+
+Expressions are sandboxed: only numbers, variables, arithmetic, comparisons,
+and/or/not, if-else and calls of the functions in FUNCTIONS are allowed
+(no strings, attributes, subscripts, lambdas...), anything else is rejected
+with ExpressionError when the expression is compiled. The expressions are
+evaluated without builtins, and powers of integers with more than
+MAX_INT_BITS bits are not computed, so an expression cannot take unbounded
+time or memory by itself.
 """
 
+import ast
+import math
+from functools import lru_cache
+
+
+class ExpressionError(Exception):
+    pass
+
+
+# Bits of the biggest integer a power (or a variable) can get
+MAX_INT_BITS = 4096
+
+
+def _pow(base, exponent):
+    if type(base) is int and type(exponent) is int and exponent > 0 and \
+            (abs(base).bit_length() - 1) * exponent > MAX_INT_BITS:
+        raise ExpressionError(f"power is too big: {base} ** {exponent}")
+    return base ** exponent
+
+
+FUNCTIONS = {
+    name: getattr(math, name)
+    for name in ['sqrt', 'sin', 'cos', 'tan', 'asin', 'acos', 'atan',
+                 'atan2', 'hypot', 'degrees', 'radians', 'floor', 'ceil',
+                 'trunc', 'exp', 'log', 'log2', 'log10', 'fabs', 'fmod',
+                 'copysign']
+}
+FUNCTIONS.update(abs=abs, min=min, max=max, round=round, int=int,
+                 float=float, bool=bool)
+
+# Globals of every expression
+GLOBALS = dict(FUNCTIONS, pi=math.pi, e=math.e, tau=math.tau,
+               __builtins__={}, __pow=_pow)
+
+_CONSTANT_TYPES = (int, float, bool, type(None))
+
+_OPERATORS = (
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+    ast.UAdd, ast.USub, ast.Not, ast.And, ast.Or,
+    ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+)
+
+
+@lru_cache(maxsize=65536)
+def compile_expr(expr):
+    tree = ast.parse(expr.strip(), mode='eval')
+    for node in ast.walk(tree):
+        _check_node(expr, node)
+    tree = _PowTransformer().visit(tree)
+    ast.fix_missing_locations(tree)
+    return compile(tree, '<pcbscript>', 'eval')
+
+
+def _check_node(expr, node):
+    if isinstance(node, (ast.Expression, ast.BinOp, ast.UnaryOp, ast.BoolOp,
+                         ast.Compare, ast.IfExp, ast.Load) + _OPERATORS):
+        return
+    if isinstance(node, ast.Constant):
+        if type(node.value) in _CONSTANT_TYPES:
+            return
+        what = f"constant {node.value!r}"
+    elif isinstance(node, ast.Name):
+        if not node.id.startswith('__'):
+            return
+        what = f"name {node.id}"
+    elif isinstance(node, ast.Call):
+        if isinstance(node.func, ast.Name) and \
+                node.func.id in FUNCTIONS and not node.keywords:
+            return
+        what = "call"
+    else:
+        what = node.__class__.__name__
+    raise ExpressionError(f"{what} is not allowed: {expr.strip()}")
+
+
+class _PowTransformer(ast.NodeTransformer):
+    # a ** b -> __pow(a, b)
+    def visit_BinOp(self, node):
+        node = self.generic_visit(node)
+        if not isinstance(node.op, ast.Pow):
+            return node
+        return ast.Call(ast.Name('__pow', ast.Load()),
+                        [node.left, node.right], [])
+
+
 class BaseValue:
     def __repr__(self):
         raise NotImplementedError()
@@ -23,6 +120,7 @@ class BaseValue:
 class Number(BaseValue):
     def __init__(self, value):
         self.value = value
+        self._code = compile_expr(value)
 
     def __repr__(self):
         return f"Number(value={self.value})"
@@ -32,7 +130,7 @@ class Number(BaseValue):
         return cls(s)
 
     def eval(self, scope={}):
-        return eval(self.value, None, scope)
+        return eval(self._code, GLOBALS, scope)
 
 
 class String(BaseValue):
@@ -54,6 +152,8 @@ class Coord(BaseValue):
     def __init__(self, x, y):
         self.x = x
         self.y = y
+        self._code_x = compile_expr(x)
+        self._code_y = compile_expr(y)
 
     def __repr__(self):
         return f"Coord(x={self.x}, y={self.y})"
@@ -64,6 +164,6 @@ class Coord(BaseValue):
         return cls(*xy)
 
     def eval(self, scope={}):
-        x = eval(self.x, None, scope)
-        y = eval(self.y, None, scope)
+        x = eval(self._code_x, GLOBALS, scope)
+        y = eval(self._code_y, GLOBALS, scope)
         return (x, y)
@@ -0,0 +1,130 @@
+"""
+Watcher blocks until one of the given files changes. On Linux it uses
+inotify (through ctypes, so no extra dependency is needed) and sleeps in
+select while nothing happens. On other systems it falls back to checking
+mtime and size of the files from time to time.
+
+Editors often save a file in several steps (truncate, write, rename), so
+the events are debounced: wait returns only when the files have been quiet
+for `debounce` seconds.
+"""
+
+import os
+import time
+import ctypes
+import ctypes.util
+import select
+import struct
+
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class BaseWatcher:
+    def __init__(self, paths, debounce=0.05):
+        self._paths = [os.path.abspath(path) for path in paths]
+        self._debounce = debounce
+
+    def wait(self):
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(BaseWatcher):
+    def __init__(self, paths, debounce=0.05):
+        super().__init__(paths, debounce)
+
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError("inotify is not supported")
+
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        # Watching directories, because editors may replace files
+        self._dirs = {}
+        self._names = set()
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        for path in self._paths:
+            dirname, name = os.path.split(path)
+            self._names.add((dirname, name))
+            if dirname not in self._dirs.values():
+                wd = libc.inotify_add_watch(self._fd, dirname.encode(), mask)
+                if wd < 0:
+                    os.close(self._fd)
+                    raise OSError(ctypes.get_errno(),
+                                  f"inotify_add_watch failed: {dirname}")
+                self._dirs[wd] = dirname
+
+    def wait(self):
+        while not self._read_events():
+            select.select([self._fd], [], [])
+
+        while select.select([self._fd], [], [], self._debounce)[0]:
+            self._read_events()
+
+    def close(self):
+        os.close(self._fd)
+
+    def _read_events(self):
+        try:
+            data = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return False
+
+        changed = False
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0').decode()
+            offset += length
+            if (self._dirs.get(wd), name) in self._names:
+                changed = True
+
+        return changed
+
+
+class StatWatcher(BaseWatcher):
+    def __init__(self, paths, debounce=0.05, interval=0.5):
+        super().__init__(paths, debounce)
+        self._interval = interval
+        self._state = self._stat()
+
+    def wait(self):
+        while self._state == self._stat():
+            time.sleep(self._interval)
+
+        state = self._stat()
+        while True:
+            time.sleep(self._debounce)
+            self._state = self._stat()
+            if self._state == state:
+                break
+            state = self._state
+
+    def _stat(self):
+        state = []
+        for path in self._paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                state.append(None)
+            else:
+                state.append((stat.st_mtime_ns, stat.st_size))
+        return state
+
+
+def create_watcher(paths, debounce=0.05):
+    try:
+        return InotifyWatcher(paths, debounce)
+    except (OSError, AttributeError, TypeError):
+        return StatWatcher(paths, debounce)
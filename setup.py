@@ -30,6 +30,9 @@ setup(
         'Pillow>=12',
         'svgwrite>=1.4',
     ],
+    extras_require={
+        'batch': ['numpy'],
+    },
     python_requires=">=3.12",
     keywords="pcb",
 )
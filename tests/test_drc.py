@@ -0,0 +1,90 @@
+"""
+Design rule check on small scripts: violations are found by rules and
+source lines, shapes of the same net are never too close, shapes that
+touch without a junction are shorts.
+"""
+
+from pcbscript.compiler import Compiler
+from pcbscript.drc import check
+
+
+HEADER = '''option GAP = 0.3
+option WIRE_WIDTH = 0.2
+board 10,10
+'''
+
+
+def _violations(code, **kwargs):
+    items = Compiler(trace=True).compile(HEADER + code)
+    return [(violation.rule, violation.line, violation.other_line)
+            for violation in check(items, **kwargs)]
+
+
+def test_clearance_between_nets():
+    assert _violations('''wire 1,2 5,2
+wire 1,2.3 5,2.3
+''') == [('clearance', 4, 5)]
+
+
+def test_far_nets():
+    assert _violations('''wire 1,2 5,2
+wire 1,3 5,3
+''') == []
+
+
+def test_u_turn_of_one_net():
+    assert _violations('''wire 1,1 5,1 5,1.4 1,1.4
+''') == []
+
+
+def test_pad_next_to_its_own_wire():
+    assert _violations('''pin 1,1 1 0.5
+wire 1,1 3,1 3,1.8 1.4,1.8
+''') == []
+
+
+def test_crossing_wires_short():
+    assert _violations('''wire 1,1 5,5
+wire 1,5 5,1
+''') == [('short', 4, 5)]
+
+
+def test_wire_grazing_pad_short():
+    assert _violations('''wire 1,3.5 5,3.5
+pin 3,3 1 0.5
+''') == [('short', 4, 5)]
+
+
+def test_touching_pads_short():
+    assert _violations('''pin 3,3 1 0.5
+pinq 3.9,3 1 0.5
+''', clearance=0) == [('short', 4, 5)]
+
+
+def test_junctions():
+    # A wire ending on a pad, a T-junction of wires, a wire through the
+    # center of a pad and stacked pads
+    assert _violations('''pin 2,2 1 0.5
+wire 2,2 2,6
+wire 2,4 6,4
+pinq 6,6 1 0.5
+wire 4,6 8,6
+pin 8,8 1 0.5
+pin 8,8 1.2 0.5
+''') == []
+
+
+def test_clearance_option():
+    code = '''wire 1,2 5,2
+wire 1,2.6 5,2.6
+'''
+    assert _violations(code) == []
+    assert _violations(code, clearance=0.5) == [('clearance', 4, 5)]
+
+
+def test_wire_width_and_holes():
+    assert _violations('''wire 1,1 5,1 0.05
+pin 8,8 1 0.05
+pinq 8,5 1 0.95
+''') == [('wire_width', 4, None), ('drill', 5, None),
+         ('annular_ring', 6, None)]
@@ -0,0 +1,172 @@
+"""
+Differential test of the engines: random scripts (loops, if-else, macros,
+translate, rotate, variables, exit) are compiled by the interpreter loop
+and by the closure engine, with and without batch, optimize and inline,
+and the results must be the same. A script that fails must fail the same
+way. Runaway loops are stopped by the same step limit in both engines,
+the other scripts are compared without limits too, as the engines lower
+the graph differently when they count steps.
+"""
+
+import random
+import itertools
+
+import pytest
+
+from pcbscript.compiler import Compiler
+from pcbscript.items import serialize
+
+
+SEEDS = range(300)
+
+# Step counts are equal in all the engines, so the limit stops them at
+# the same place
+MAX_STEPS = 20000
+
+OPTIONS = [
+    dict(batch=batch, optimize=optimize, inline=inline)
+    for batch, optimize, inline in itertools.product([False, True],
+                                                     repeat=3)
+]
+
+
+def _expr(r, names):
+    values = [str(r.randint(-2, 3))] + names
+    result = r.choice(values)
+    if r.random() < 0.5:
+        result = f"({result}{r.choice('+-*')}{r.choice(values)})"
+    return result
+
+
+def _loop_body(r, names, var, lines, indent):
+    # Items only, the kind of loop batch can take
+    names = names + [var]
+    for _ in range(r.randint(1, 3)):
+        kind = r.choice(['pin', 'pinq', 'wire'])
+        if kind == 'wire':
+            width = r.choice(['', ' 0.3', ' 0.5'])
+            lines.append(f"{indent}wire {_expr(r, names)},{_expr(r, names)} "
+                         f"{_expr(r, names)},{var}/2{width}")
+        else:
+            size = r.choice(['', ' 0.7', f' {var}'])
+            lines.append(f"{indent}{kind} {_expr(r, names)},"
+                         f"(-{var}*0.5+1){size}")
+
+
+def _block(r, depth, names, macros, lines, indent):
+    inner = indent + '    '
+    for _ in range(r.randint(1, 4)):
+        k = r.random()
+        if depth < 3 and k < 0.08:
+            var = f"v{depth}{r.randint(0, 9)}"
+            lines.append(f"{indent}for {var} in {_expr(r, names)}.."
+                         f"{_expr(r, names)}:")
+            _loop_body(r, names, var, lines, inner)
+        elif depth < 3 and k < 0.15:
+            var = f"v{depth}{r.randint(0, 9)}"
+            lines.append(f"{indent}for {var} in {_expr(r, names)}.."
+                         f"{_expr(r, names)}:")
+            _block(r, depth + 1, names + [var], macros, lines, inner)
+        elif depth < 3 and k < 0.3:
+            lines.append(f"{indent}if {_expr(r, names)}>{_expr(r, names)}:")
+            _block(r, depth + 1, names, macros, lines, inner)
+            if r.random() < 0.5:
+                lines.append(f"{indent}else:")
+                _block(r, depth + 1, names, macros, lines, inner)
+        elif depth < 3 and k < 0.4:
+            lines.append(f"{indent}translate {_expr(r, names)},"
+                         f"{_expr(r, names)}:")
+            _block(r, depth + 1, names, macros, lines, inner)
+        elif depth < 3 and k < 0.47:
+            lines.append(f"{indent}rotate {_expr(r, names)}:")
+            _block(r, depth + 1, names, macros, lines, inner)
+        elif k < 0.55 and macros:
+            name, count = r.choice(macros)
+            args = ', '.join(_expr(r, names) for _ in range(count))
+            lines.append(f"{indent}{name}({args})")
+        elif k < 0.6:
+            lines.append(f"{indent}var {r.choice(['g1', 'g2'])} = "
+                         f"{_expr(r, names)}")
+        elif k < 0.62:
+            lines.append(f"{indent}if {_expr(r, names)}>4:")
+            lines.append(f"{inner}exit")
+        elif k < 0.65:
+            lines.append(f"{indent}option GAP = 0.{r.randint(1, 9)}")
+        elif k < 0.75:
+            lines.append(f"{indent}pinq {_expr(r, names)},{_expr(r, names)}")
+        elif k < 0.85:
+            lines.append(f"{indent}wire {_expr(r, names)},{_expr(r, names)} "
+                         f"{_expr(r, names)},1 2,{_expr(r, names)}")
+        elif k < 0.9:
+            lines.append(f'{indent}text "t" {_expr(r, names)},1')
+        else:
+            lines.append(f"{indent}pin {_expr(r, names)},{_expr(r, names)} "
+                         f"0.9")
+
+
+def random_script(seed):
+    r = random.Random(seed)
+    lines = ["board 10,10", "var g1 = 1", "var g2 = 2"]
+    macros = []
+    for number in range(r.randint(0, 3)):
+        count = r.randint(0, 3)
+        params = r.sample(['x', 'y', 'z', 'g1'], count)
+        lines.append(f"macro m{number}({', '.join(params)}):")
+        _block(r, 1, params + ['g1'], list(macros), lines, '    ')
+        macros.append((f"m{number}", count))
+    _block(r, 0, ['g1', 'g2'], macros, lines, '')
+    return '\n'.join(lines)
+
+
+def _run(code, max_steps=MAX_STEPS, **options):
+    try:
+        items = Compiler(max_steps=max_steps, **options).compile(code)
+    except Exception as exc:
+        return f"{type(exc).__name__}: {exc}"
+    return [serialize(item) for item in items]
+
+
+def _is_runaway(result):
+    return isinstance(result, str) and result.startswith('BudgetError')
+
+
+@pytest.mark.parametrize('options', OPTIONS,
+                         ids=lambda options: ','.join(
+                             name for name, on in options.items() if on
+                         ) or 'plain')
+def test_engines_agree(options):
+    for seed in SEEDS:
+        code = random_script(seed)
+        expected = _run(code, engine='interpreter', **options)
+        result = _run(code, engine='closure', **options)
+        assert result == expected, f"seed {seed}:\n{code}"
+
+        if not _is_runaway(expected):
+            for engine in ('interpreter', 'closure'):
+                result = _run(code, None, engine=engine, **options)
+                assert result == expected, \
+                    f"seed {seed}, {engine} without limit:\n{code}"
+
+
+def test_options_agree():
+    # Batch, optimize and inline do not change the result either
+    for seed in SEEDS:
+        code = random_script(seed)
+        expected = _run(code, engine='interpreter', batch=False,
+                        optimize=False, inline=False)
+        for options in OPTIONS[1:]:
+            assert _run(code, engine='closure', **options) == expected, \
+                f"seed {seed}, {options}:\n{code}"
+
+
+@pytest.mark.parametrize('max_steps', [10, 30, 100, 300, 1000])
+def test_step_limits_agree(max_steps):
+    # A script fits a limit in every engine or in none
+    for seed in SEEDS:
+        code = random_script(seed)
+        expected = _run(code, max_steps, engine='interpreter')
+        for engine, batch in (('interpreter', False), ('closure', True),
+                              ('closure', False)):
+            result = _run(code, max_steps, engine=engine, batch=batch)
+            assert result == expected, \
+                f"seed {seed}, {engine}, batch={batch}:\n{code}"
@@ -0,0 +1,54 @@
+"""
+Raster output in strips: the PNG written strip by strip must have the
+same pixels as the sheet rendered at once, at strip sizes that cut
+through pins, pinqs, wires, texts and the frame of the board.
+"""
+
+import os
+
+import pytest
+
+pytest.importorskip('PIL')
+
+from PIL import Image
+
+from pcbscript.compiler import Compiler
+from pcbscript.rasterdrawer import RasterDrawer
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXAMPLE = os.path.join(ROOT, 'examples', 'example.pcbs')
+
+
+def _pixels(path):
+    with Image.open(path) as image:
+        return image.mode, image.size, image.tobytes()
+
+
+def _prepare(items, path, **kwargs):
+    drawer = RasterDrawer(**kwargs)
+    drawer.draw(items)
+    drawer.prepare_a4(str(path), 300, (0.31, 0.77), 1.02)
+    return _pixels(path)
+
+
+@pytest.mark.parametrize('strip', [5, 17, 64])
+@pytest.mark.parametrize('supersample', [1, 2, 3])
+def test_strips_match_full_render(strip, supersample, tmp_path):
+    with open(EXAMPLE) as f:
+        items = Compiler().compile(f.read())
+
+    expected = _prepare(items, tmp_path / 'full.png',
+                        supersample=supersample)
+    result = _prepare(items, tmp_path / 'strips.png',
+                      supersample=supersample, strip=strip)
+    assert result == expected
+
+
+def test_strips_of_workers(tmp_path):
+    with open(EXAMPLE) as f:
+        items = Compiler().compile(f.read())
+
+    expected = _prepare(items, tmp_path / 'full.png')
+    result = _prepare(items, tmp_path / 'strips.png', strip=13, workers=2)
+    assert result == expected
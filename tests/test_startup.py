@@ -0,0 +1,115 @@
+"""
+Startup of the command line: `import pcbscript` and every action are run
+in a new Python process, as pcbscript is run from a shell, and the heavy
+modules are checked to be imported only by the actions that need them
+(see backends module). The wall time of every run is recorded as the
+property startup_ms (shown with -s or in the JUnit XML report).
+"""
+
+import os
+import sys
+import json
+import time
+import importlib
+import subprocess
+
+import pytest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXAMPLE = os.path.join(ROOT, 'examples', 'example.pcbs')
+
+# Modules that the command line must not import unless an action needs
+# them: drawing libraries, NumPy, the batch runner and the watcher
+HEAVY = ['svgwrite', 'cairosvg', 'PIL', 'numpy', 'pcbscript.runner',
+         'pcbscript.watcher']
+
+# Runs the command line (or only imports pcbscript if there is no
+# argv) and saves the names of the imported modules
+_PROBE = '''
+import sys
+import json
+
+argv, path = json.loads(sys.argv[1]), sys.argv[2]
+code = 0
+import pcbscript
+if argv:
+    sys.argv = ['pcbscript'] + argv
+    try:
+        pcbscript.main()
+    except SystemExit as exc:
+        code = exc.code
+with open(path, 'w') as f:
+    json.dump({'code': code, 'modules': sorted(sys.modules)}, f)
+'''
+
+
+def _has_cairo():
+    try:
+        importlib.import_module('cairosvg')
+    except Exception:
+        return False
+    return True
+
+
+def _action(name, argv, suffix=None, allowed=(), marks=()):
+    # argv is without the output, suffix is the one of the output file,
+    # allowed are the heavy modules the action needs
+    return pytest.param(name, argv, suffix, list(allowed), id=name,
+                        marks=marks)
+
+
+ACTIONS = [
+    _action('import', None),
+    _action('version', ['version']),
+    _action('compile', ['compile', '-i', EXAMPLE], '.txt'),
+    _action('compile-pcbi', ['compile', '-i', EXAMPLE], '.pcbi'),
+    _action('draw-stream', ['draw', '-i', EXAMPLE, '--backend', 'stream'],
+            '.svg'),
+    _action('draw-svgwrite', ['draw', '-i', EXAMPLE], '.svg',
+            ['svgwrite', 'cairosvg', 'PIL'],
+            pytest.mark.skipif(not _has_cairo(),
+                               reason="CairoSVG is not usable")),
+    _action('prepare-raster',
+            ['prepare', '-i', EXAMPLE, '--backend', 'raster'], '.png',
+            ['PIL']),
+    _action('gerber', ['gerber', '-i', EXAMPLE], '.gbr'),
+    _action('check', ['check', '-i', EXAMPLE]),
+    _action('nets', ['nets', '-i', EXAMPLE]),
+    _action('profile', ['profile', '-i', EXAMPLE]),
+]
+
+
+def _run(argv, tmp_path):
+    path = tmp_path / 'probe.json'
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        filter(None, [ROOT, env.get('PYTHONPATH')])
+    )
+    started = time.perf_counter()
+    subprocess.run(
+        [sys.executable, '-c', _PROBE, json.dumps(argv), str(path)],
+        cwd=tmp_path, env=env, check=True, stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    elapsed = time.perf_counter() - started
+    with open(path) as f:
+        return json.load(f), elapsed
+
+
+@pytest.mark.parametrize('name, argv, suffix, allowed', ACTIONS)
+def test_startup(name, argv, suffix, allowed, tmp_path, record_property):
+    if argv is not None:
+        argv = argv + ['--no-daemon', '--no-cache']
+        if suffix is not None:
+            argv += ['-o', str(tmp_path / f"out{suffix}")]
+
+    result, elapsed = _run(argv, tmp_path)
+
+    record_property('startup_ms', round(elapsed * 1e3, 1))
+    print(f"{name}: {elapsed * 1e3:.1f} ms")
+
+    assert result['code'] in (0, None)
+    imported = [module for module in HEAVY
+                if module in result['modules'] and module not in allowed]
+    assert not imported, f"{name} imports {', '.join(imported)}"